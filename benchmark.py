@@ -0,0 +1,348 @@
+"""
+Benchmark harness for the JSON loading and processing functions.
+
+Generates synthetic respondent files of the schema `processing.py` expects and
+reports wall time, peak RSS and rows/sec for every stage. Results are saved as
+JSON so two runs (e.g. before/after a change) can be compared:
+
+    python benchmark.py --sizes 1000 10000 --label baseline
+    python benchmark.py --compare bench_results/baseline.json bench_results/new.json
+"""
+import argparse
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: peak RSS is reported as None
+    resource = None
+
+price_file = r"product_price_tag.csv"
+
+# --- Synthetic Respondent Generator ---
+EDUCATION_LEVELS = ['high', 'college', 'master', 'phd']
+OCCUPATIONS = ['회사원', '자영업', '공무원', '전문직', '주부', '학생', '무직']
+INCOME_RANGES = ['100만원 미만', '100-200만원', '200-300만원', '300-500만원', '500만원 이상', '']
+BRANDS = ['LG', 'Samsung', 'Winia', 'Cuckoo', 'Coway', 'Dyson']
+PETS = ['dog', 'cat', 'fish', 'bird']
+CAR_MAKES = ['hyundai', 'kia', 'genesis', 'bmw', 'benz', 'tesla']
+
+
+def load_products(file_path=price_file):
+    """
+    Return (product_id, kind) pairs from the price file; 'None' kinds become None.
+    """
+    price_df = pd.read_csv(file_path, encoding='utf-8-sig', keep_default_na=False)
+    return [(pid, None if kind == 'None' else kind) for pid, kind in zip(price_df['product_id'], price_df['kind'])]
+
+
+def generate_respondent(respondent_id, rnd, products, current_year=2024, regions=('KOR', 'KOR', 'KOR', 'US')):
+    """
+    Generate one synthetic respondent record.
+
+    Parameters:
+        - respondent_id: Value of the `id` field.
+        - rnd: `random.Random` instance.
+        - products: (product_id, kind) pairs to draw purchases from.
+        - current_year: Year the survey ages are computed for.
+        - regions: Regions to draw from (repeat a region to weight it).
+
+    Returns:
+        - A dictionary with demographics and purchase/education/job/residence/
+          interior/children/pet/vehicle histories.
+    """
+    birth = rnd.randint(1945, 2002)
+    age = current_year - birth
+
+    def year_after(offset=18):
+        return rnd.randint(min(birth + offset, current_year), current_year)
+
+    married = rnd.random() < 0.6
+    education = [
+        {'level': rnd.choice(EDUCATION_LEVELS), 'age': 18 + 2 * i + rnd.randint(0, 2), 'year': birth + 18 + 2 * i}
+        for i in range(rnd.randint(1, 3))
+    ]
+    children = []
+    for order in range(1, (rnd.randint(0, 3) if married else 0) + 1):
+        child_year = year_after(22)
+        children.append({
+            'order': order,
+            'year': child_year,
+            'age_of_birth': child_year - birth,
+            'year_elementary': child_year + 7 if child_year + 7 <= current_year else None,
+            'year_middle': child_year + 13 if child_year + 13 <= current_year else None,
+            'year_high': child_year + 16 if child_year + 16 <= current_year else None,
+            'married_year': child_year + 30 if child_year + 30 <= current_year else None,
+        })
+
+    purchases = []
+    for _ in range(rnd.randint(0, 12)):
+        product_id, kind = rnd.choice(products)
+        purchases.append({'year': year_after(), 'name': product_id, 'kind_name': kind, 'brand_name': rnd.choice(BRANDS)})
+
+    record = {
+        'id': respondent_id,
+        'age': age,
+        'ages': f"{age // 10 * 10}대",
+        'gender': rnd.choice([1, 2]),
+        'marriage': year_after(22) if married else 0,
+        'birth': birth,
+        'occupation_name': rnd.choice(OCCUPATIONS),
+        'income': {'self_income_range': rnd.choice(INCOME_RANGES), 'hh_income_range': rnd.choice(INCOME_RANGES)},
+        'region': rnd.choice(regions),
+        'purchase': {'history': purchases},
+        'education': {'history': education},
+        'job': {'history': [
+            {'job_name': rnd.choice(OCCUPATIONS), 'job_age_of': 20 + 5 * i, 'year': birth + 20 + 5 * i,
+             'job_wage': rnd.randint(20, 120) * 100000}
+            for i in range(rnd.randint(0, 4))
+        ]},
+        'residence': {'history': [
+            {'ownership': rnd.choice(['자가', '전세', '월세']), 'type': rnd.choice(['아파트', '빌라', '단독']),
+             'size': rnd.randint(10, 60), 'age_of_move_in': 20 + 4 * i, 'year': birth + 20 + 4 * i}
+            for i in range(rnd.randint(0, 5))
+        ]},
+        'interior': {'history': [{'year': year_after(25), 'cost_amt': rnd.randint(1, 100) * 100000}
+                                 for _ in range(rnd.randint(0, 3))]},
+        'children': {'history': children},
+        'pet': {'history': [{'year': year_after(), 'kind': rnd.choice(PETS)} for _ in range(rnd.randint(0, 2))]},
+        'vehicle': {'history': [
+            {'year': year_after(), 'purchase': rnd.choice(['new', 'used']), 'make': rnd.choice(CAR_MAKES),
+             'kind': rnd.choice(['sedan', 'suv', 'ev'])}
+            for _ in range(rnd.randint(0, 3))
+        ]},
+    }
+    if rnd.random() < 0.2:
+        record['brand_name'] = rnd.choice(BRANDS)
+    return record
+
+
+def write_respondent_file(path, size, seed=0, price_path=price_file):
+    """
+    Write a synthetic respondent file (top-level JSON array) with `size` records.
+
+    Records are written one at a time, so large files do not need to fit in memory.
+    """
+    rnd = random.Random(seed)
+    products = load_products(price_path)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('[')
+        for respondent_id in range(size):
+            if respondent_id:
+                file.write(',\n')
+            json.dump(generate_respondent(respondent_id, rnd, products), file, ensure_ascii=False)
+        file.write(']')
+    return path
+
+
+# --- Stage Measurement ---
+def _peak_rss_mb():
+    """
+    Return this process's peak resident set size in MB, or None if unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _open_upload(path):
+    """
+    Return the file as an in-memory upload, like Streamlit's UploadedFile.
+    """
+    with open(path, 'rb') as source:
+        file = io.BytesIO(source.read())
+    file.name = os.path.basename(path)
+    return file
+
+
+def _run_stage(stage, path, price_path, year, locations, repeat):
+    """
+    Run one stage in the current (fresh) process and measure it.
+
+    Inputs a stage depends on (e.g. the normalized tables for the processing
+    options) are prepared first and excluded from the timing; their memory is
+    reported as `input_rss_mb`.
+    """
+    import processing
+
+    name = 'Bench_' + os.path.basename(path)
+    options = {
+        'process_selected_files_1': lambda data: processing.process_selected_files_1(data, [name], locations=locations),
+        'process_selected_files_2': lambda data: processing.process_selected_files_2(
+            data, [name], year=year, locations=locations, price_file=price_path),
+        'process_selected_files_3': lambda data: processing.process_selected_files_3(
+            data, [name], locations=locations, price_file=price_path),
+    }
+
+    data = None
+    if stage in options:
+        with _open_upload(path) as file:
+            data = [processing.load_json_files([file], streaming=True, normalize=True)[file.name]]
+        rows_in = len(data[0]['person'])
+    gc.collect()
+    input_rss = _peak_rss_mb()
+
+    timings = []
+    rows_out = None
+    load_kwargs = {
+        'load_json_files': {},
+        'load_json_files[streaming]': {'streaming': True},
+        'load_json_files[normalize]': {'streaming': True, 'normalize': True},
+    }
+    for _ in range(repeat):
+        # Uploads are in memory in the app, so reading the file is not timed
+        upload = _open_upload(path) if stage in load_kwargs else None
+        start = time.perf_counter()
+        if stage == 'load_price_data':
+            result = processing.load_price_data(price_path)
+            rows_in = rows_out = len(result)
+        elif stage in load_kwargs:
+            result = processing.load_json_files([upload], **load_kwargs[stage])[upload.name]
+            rows_in = rows_out = len(result['person'] if isinstance(result, dict) else result)
+        else:
+            result = options[stage](data)
+            rows_out = len(result)
+        timings.append(time.perf_counter() - start)
+        del result, upload
+        gc.collect()
+
+    wall = min(timings)
+    return {
+        'stage': stage,
+        'wall_s': wall,
+        'wall_s_all': timings,
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'rows_per_s': rows_in / wall if wall > 0 else None,
+        'input_rss_mb': input_rss,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+STAGES = [
+    'load_json_files',
+    'load_json_files[streaming]',
+    'load_json_files[normalize]',
+    'load_price_data',
+    'process_selected_files_1',
+    'process_selected_files_2',
+    'process_selected_files_3',
+]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, stages=STAGES, repeat=3, seed=0, year=2010, locations=('KOR', 'US'),
+                   data_dir='bench_data', price_path=price_file):
+    """
+    Benchmark every stage for every respondent count.
+
+    Each stage runs in a fresh worker process so its peak RSS is not inflated
+    by earlier stages.
+
+    Parameters:
+        - sizes: Respondent counts of the generated files.
+        - stages: Stage names from `STAGES`.
+        - repeat: Timed runs per stage (the fastest is reported as `wall_s`).
+        - seed: Seed of the synthetic data (same seed, same files).
+        - year, locations: Processing parameters for Options 1-3.
+        - data_dir: Directory for the generated files (reused when present).
+
+    Returns:
+        - A dictionary with run metadata and one result per (size, stage).
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in sizes:
+        path = os.path.join(data_dir, f"respondents_{size}_seed{seed}.json")
+        if not os.path.exists(path):
+            write_respondent_file(path, size, seed=seed, price_path=price_path)
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(_run_stage, stage, path, price_path, year, list(locations), repeat).result()
+            result.update({'size': size, 'file_mb': os.path.getsize(path) / (1 << 20)})
+            results.append(result)
+            print(f"{size:>10} {stage:<28} {result['wall_s']:>9.3f}s "
+                  f"{result['rows_per_s'] or 0:>12,.0f} rows/s  peak {result['peak_rss_mb'] or 0:>8.1f} MB",
+                  flush=True)
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {'repeat': repeat, 'seed': seed, 'year': year, 'locations': list(locations)},
+        'results': results,
+    }
+
+
+def compare_results(baseline, candidate):
+    """
+    Compare two saved benchmark runs.
+
+    Returns:
+        - A DataFrame per (size, stage) with both wall times, peak RSS and the
+          speedup (baseline / candidate wall time).
+    """
+    keys = ['size', 'stage']
+    old = pd.DataFrame(baseline['results'])[keys + ['wall_s', 'peak_rss_mb']]
+    new = pd.DataFrame(candidate['results'])[keys + ['wall_s', 'peak_rss_mb']]
+    merged = old.merge(new, on=keys, suffixes=('_baseline', '_candidate'))
+    merged['speedup'] = merged['wall_s_baseline'] / merged['wall_s_candidate']
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark JSON loading and processing options.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="Respondents per generated file.")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--year', type=int, default=2010)
+    parser.add_argument('--locations', nargs='+', default=['KOR', 'US'])
+    parser.add_argument('--data-dir', default='bench_data')
+    parser.add_argument('--output-dir', default='bench_results')
+    parser.add_argument('--label', default=None, help="Name of the saved result file (default: timestamp).")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="Compare two saved result files instead of running.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f_old, open(args.compare[1], encoding='utf-8') as f_new:
+            print(compare_results(json.load(f_old), json.load(f_new)).to_string(index=False))
+        return
+
+    run = run_benchmarks(args.sizes, stages=args.stages, repeat=args.repeat, seed=args.seed, year=args.year,
+                         locations=args.locations, data_dir=args.data_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    label = args.label or time.strftime('%Y%m%d-%H%M%S')
+    output = os.path.join(args.output_dir, f"{label}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(run, file, ensure_ascii=False, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# --- Content Hashing ---
+def file_digest(file, block_size=1 << 20):
+    """
+    Compute the SHA-256 hex digest of an uploaded (or opened) file's content.
+
+    The file is read in blocks and rewound afterwards so it can still be parsed.
+
+    Parameters:
+        - file: Binary file object.
+        - block_size: Number of bytes hashed per read.
+
+    Returns:
+        - The hex digest string.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        digest.update(block if isinstance(block, bytes) else block.encode('utf-8'))
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def file_mtime(file_path):
+    """
+    Return the modification time of a file, or None if it does not exist.
+    """
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return None
+
+
+def estimate_size(value):
+    """
+    Estimate the in-memory size of a cached value in bytes.
+
+    DataFrames are measured with `memory_usage(deep=True)`; lists, tuples and
+    dictionaries are summed over their items. Other objects are measured with
+    `sys.getsizeof`, so classes holding large data (e.g. `PivotCube`) report it
+    through `__sizeof__`.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+# --- Size-Bounded LRU Cache ---
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and total size.
+
+    Streamlit serves every session from its own thread, so a single instance can
+    be shared between reruns and sessions (e.g. through `st.cache_resource`).
+    """
+
+    def __init__(self, max_entries=32, max_bytes=1 << 30):
+        """
+        Parameters:
+            - max_entries: Maximum number of cached values.
+            - max_bytes: Maximum total estimated size of the cached values.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for `key` and mark it as recently used.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """
+        Store `value` under `key`, evicting least recently used entries as needed.
+
+        Values larger than `max_bytes` on their own are not cached.
+        """
+        size = estimate_size(value)
+        with self._lock:
+            self.discard(key)
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict()
+        return value
+
+    def resize(self, key):
+        """
+        Re-estimate the size of a cached value that grew or shrank in place (e.g.
+        a `PivotCube` that aggregated another cube), evicting entries as needed.
+
+        A value that no longer fits in `max_bytes` on its own is dropped.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return
+            value = self._entries[key]
+        size = estimate_size(value)
+        with self._lock:
+            if self._entries.get(key) is not value:
+                return
+            self._total_bytes += size - self._sizes[key]
+            self._sizes[key] = size
+            if size > self.max_bytes:
+                self.discard(key)
+            else:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until both bounds hold again
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(oldest)
+
+    def discard(self, key):
+        """
+        Remove `key` from the cache if present.
+        """
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                self._total_bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        """
+        Return the cached value for `key`, computing and storing it on a miss.
+
+        Parameters:
+            - key: Hashable cache key (e.g. content hash plus processing parameters).
+            - func: Callable producing the value; called as `func(*args, **kwargs)`.
+
+        Returns:
+            - The cached or freshly computed value.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, func(*args, **kwargs))
+        return value
@@ -0,0 +1,110 @@
+import gzip
+import io
+
+import pandas as pd
+
+# --- Export Formats: name -> (mime type, file extension) ---
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def iter_csv_chunks(df, chunk_rows=100000):
+    """
+    Yield a DataFrame as UTF-8 CSV bytes, a block of rows at a time.
+
+    The byte order mark and the header are written once, with the first block,
+    so Excel still opens the Korean text correctly.
+
+    Parameters:
+        - df: DataFrame to export.
+        - chunk_rows: Number of rows encoded per block.
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        first = start == 0
+        text = df.iloc[start:start + chunk_rows].to_csv(index=False, header=first)
+        yield text.encode('utf-8-sig' if first else 'utf-8')
+
+
+def _parquet_safe(df):
+    """
+    Convert object columns holding mixed value types (e.g. Option 3 `detail`)
+    to strings so they can be stored in a typed Parquet column.
+    """
+    mixed = [
+        column for column in df.columns
+        if df[column].dtype == object
+        and pd.api.types.infer_dtype(df[column], skipna=True) not in ('string', 'empty')
+    ]
+    if not mixed:
+        return df
+    df = df.copy()
+    for column in mixed:
+        df[column] = df[column].map(lambda value: value if value is None or pd.isna(value) else str(value))
+    return df
+
+
+def write_export(df, file, fmt='csv', chunk_rows=100000):
+    """
+    Write a DataFrame to a binary file object in the chosen export format.
+
+    Parameters:
+        - df: DataFrame to export.
+        - file: Writable binary file object.
+        - fmt: One of `EXPORT_FORMATS` ('csv', 'csv.gz', 'parquet').
+        - chunk_rows: Number of rows encoded per CSV block.
+
+    Raises:
+        - ValueError: If the format is not supported.
+        - ImportError: If Parquet is requested without pyarrow installed.
+    """
+    if fmt == 'csv':
+        for chunk in iter_csv_chunks(df, chunk_rows):
+            file.write(chunk)
+    elif fmt == 'csv.gz':
+        with gzip.GzipFile(fileobj=file, mode='wb') as gz:
+            for chunk in iter_csv_chunks(df, chunk_rows):
+                gz.write(chunk)
+    elif fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet export requires the 'pyarrow' package.")
+        _parquet_safe(df).to_parquet(file, index=False)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def available_formats():
+    """
+    Return the names of the export formats whose dependencies are installed.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet']
+    return list(EXPORT_FORMATS)
+
+
+def export_bytes(df, fmt='csv', chunk_rows=100000):
+    """
+    Export a DataFrame and return the file content.
+
+    Blocks are encoded one at a time straight into the output buffer, so the
+    full CSV text is never held as a string next to the encoded bytes.
+    Meant to be passed (wrapped in a lambda) as deferred `st.download_button`
+    data, so the export only runs when the user clicks download.
+
+    Parameters:
+        - df: DataFrame to export.
+        - fmt: One of `EXPORT_FORMATS`.
+        - chunk_rows: Number of rows encoded per CSV block.
+
+    Returns:
+        - The exported file as bytes.
+    """
+    buffer = io.BytesIO()
+    write_export(df, buffer, fmt=fmt, chunk_rows=chunk_rows)
+    return buffer.getvalue()
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from cache import file_mtime
+from processing import (
+    _as_tables, _record_hashes, _select_people, merge_partial_results, price_file, source_label,
+)
+
+
+# --- Respondent Fingerprints ---
+def respondent_fingerprints(data):
+    """
+    Compute one fingerprint per respondent `id` over all of its normalized rows.
+
+    A fingerprint changes when the respondent's person fields or any of its
+    history entries (including their order, via `_seq`) change. Respondents
+    sharing an `id` are fingerprinted together.
+
+    Parameters:
+        - data: A respondent DataFrame or its normalized tables.
+
+    Returns:
+        - A uint64 Series indexed by `id`.
+    """
+    tables = _as_tables(data)
+    person = tables['person']
+
+    # One column per table: the person row hash, then the sum of each history's row hashes
+    row_fingerprints = _record_hashes(tables)
+
+    # Combine the rows of each id, keeping the order in which duplicates appear
+    ids = person['id']
+    row_fingerprints.insert(0, '_occurrence', ids.groupby(ids, dropna=False, sort=False).cumcount().to_numpy())
+    hashes = pd.util.hash_pandas_object(row_fingerprints, index=False).to_numpy()
+    codes, uniques = pd.factorize(ids, use_na_sentinel=False)
+    fingerprints = np.zeros(len(uniques), dtype='uint64')
+    np.add.at(fingerprints, codes, hashes)
+    return pd.Series(fingerprints, index=pd.Index(uniques, name='id'), name='fingerprint')
+
+
+# --- Incremental Processing ---
+def update_incremental(option, data, filename, state=None, fingerprints=None, aggregate=None, **kwargs):
+    """
+    Process a new wave of a source, reprocessing only respondents that changed.
+
+    Parameters:
+        - option: One of `process_selected_files_1/2/3`.
+        - data: The new wave as a respondent DataFrame or normalized tables.
+        - filename: Filename of the new wave.
+        - state: State returned by the previous call for the same source and
+          parameters, or None to process the whole file.
+        - fingerprints: Precomputed `respondent_fingerprints(data)` (e.g. cached per
+          upload and shared by the options); computed here if None.
+        - aggregate: Optional `(compute, merge)` pair maintaining an aggregate of
+          the result (e.g. `(event_crosstab, merge_crosstabs)`). `compute(df)`
+          aggregates rows and `merge(parts, removed=...)` adds up aggregates and
+          subtracts removed ones. The aggregate is updated from the rows that
+          changed instead of being recomputed from the whole result.
+        - **kwargs: Parameters passed to the option (locations, year, price_file).
+
+    Returns:
+        - (result, state): The option's output for the whole wave (identical to a
+          full run, in the same sort order) and the state for the next wave.
+          `state['stats']` counts the processed, reused and removed respondents,
+          and `state['aggregate']` holds the aggregate (None without `aggregate`).
+    """
+    tables = _as_tables(data)
+    if fingerprints is None:
+        fingerprints = respondent_fingerprints(tables)
+    label = source_label(option, filename)
+    # Prices are looked up per purchase, so a changed price file invalidates the state
+    price_version = file_mtime(kwargs.get('price_file', price_file))
+
+    usable = (
+        state is not None
+        and state['option'] is option
+        and state['source'] == label
+        and state['params'] == kwargs
+        and state['price_version'] == price_version
+    )
+    if not usable:
+        result = option([tables], [filename], **kwargs)
+        stats = {'processed': len(fingerprints), 'reused': 0, 'removed': 0}
+        summary = aggregate[0](result) if aggregate is not None else None
+    else:
+        previous = state['fingerprints']
+        common = fingerprints.index.intersection(previous.index)
+        changed = common[fingerprints[common].to_numpy() != previous[common].to_numpy()]
+        added = fingerprints.index.difference(previous.index)
+        removed = previous.index.difference(fingerprints.index)
+        stale = changed.append(added)
+
+        # Reprocess new and changed respondents, drop the rows of stale and removed ones
+        mask = tables['person']['id'].isin(stale).to_numpy()
+        fresh = option([_select_people(tables, mask)], [filename], **kwargs)
+        previous_result = state['result']
+        dropped = previous_result['id'].isin(stale.append(removed)).to_numpy()
+        kept = previous_result[~dropped]
+        result = merge_partial_results(option, [kept, fresh])
+        if aggregate is None:
+            summary = None
+        elif state.get('aggregate') is None:
+            summary = aggregate[0](result)
+        else:
+            # Subtract the previous rows of stale and removed respondents, add their new rows
+            compute, merge = aggregate
+            summary = merge([state['aggregate'], compute(fresh)], removed=[compute(previous_result[dropped])])
+        stats = {'processed': len(stale), 'reused': len(fingerprints) - len(stale), 'removed': len(removed)}
+
+    state = {
+        'option': option,
+        'source': label,
+        'params': kwargs,
+        'price_version': price_version,
+        'fingerprints': fingerprints,
+        'result': result,
+        'aggregate': summary,
+        'stats': stats,
+    }
+    return result, state
@@ -0,0 +1,199 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# --- Active Recorder ---
+# Set by `recording`; stages run without an active recorder cost one lookup
+_active = contextvars.ContextVar('stage_recorder', default=None)
+# Innermost open stage as (recorder, record); per thread/task, so stages of a
+# recorder shared by several threads (e.g. a deferred download) nest correctly
+_open_stage = contextvars.ContextVar('open_stage', default=None)
+# Called with the stage name whenever a stage starts (e.g. to cancel a background job)
+_checkpoint = contextvars.ContextVar('stage_checkpoint', default=None)
+# tracemalloc is process-wide, so only one recorder measures memory at a time
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+class StageRecorder:
+    """
+    Collects the timing, row counts and (optionally) peak memory of named stages.
+
+    Stages nest: each record keeps the name of its parent stage and its depth,
+    so a slow option can be broken down into its steps.
+    """
+
+    def __init__(self, trace_memory=False, max_records=1000):
+        """
+        Parameters:
+            - trace_memory: Measure the peak of Python allocations per stage with
+              tracemalloc (slows the measured code down noticeably). Only one
+              recorder traces at a time (see `recording`).
+            - max_records: Number of most recent records kept.
+        """
+        self.trace_memory = trace_memory
+        self.max_records = max_records
+        self.records = []
+        self._lock = threading.Lock()
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            del self.records[:-self.max_records]
+
+    def extend(self, records):
+        """
+        Append records collected by another recorder (e.g. of a background job).
+        """
+        with self._lock:
+            self.records.extend(records)
+            del self.records[:-self.max_records]
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def to_frame(self):
+        """
+        Return the records as a DataFrame, one row per finished stage.
+        """
+        with self._lock:
+            records = list(self.records)
+        return pd.DataFrame(records, columns=[
+            'started', 'stage', 'parent', 'depth', 'elapsed_s', 'rows_in', 'rows_out', 'peak_mb', 'info'])
+
+    def to_json(self):
+        """
+        Return the records as JSON text (e.g. for a download button).
+        """
+        with self._lock:
+            records = list(self.records)
+        return json.dumps(records, ensure_ascii=False, indent=2, default=str)
+
+
+@contextmanager
+def recording(recorder):
+    """
+    Send the stages run inside the block to `recorder`.
+
+    If the recorder traces memory, it starts tracemalloc for the block, unless
+    another recorder (e.g. a concurrent job or session) or other code is
+    already tracing: stages then get no `peak_mb` rather than a wrong one.
+    Peaks are process-wide, so they still include allocations made by other
+    threads while the stage runs.
+    """
+    global _tracer
+    owner = False
+    if recorder.trace_memory:
+        with _tracer_lock:
+            if _tracer is None and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracer = recorder
+                owner = True
+    token = _active.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _active.reset(token)
+        if owner:
+            with _tracer_lock:
+                tracemalloc.stop()
+                _tracer = None
+
+
+@contextmanager
+def checkpoint(func):
+    """
+    Call `func(stage_name)` at the start of every stage run inside the block.
+
+    The callable may raise to abort the work at the next stage boundary.
+    """
+    token = _checkpoint.set(func)
+    try:
+        yield
+    finally:
+        _checkpoint.reset(token)
+
+
+@contextmanager
+def stage(name, rows_in=None, **info):
+    """
+    Measure one stage of loading or processing.
+
+    Parameters:
+        - name: Stage name (e.g. 'option2.price').
+        - rows_in: Number of input rows, if known.
+        - **info: Extra details stored with the record (e.g. the filename).
+
+    Yields:
+        - A dictionary; set `record['rows_out']` (or `rows_in`) inside the block.
+    """
+    hook = _checkpoint.get()
+    if hook is not None:
+        hook(name)
+    recorder = _active.get()
+    if recorder is None:
+        yield {'rows_in': rows_in, 'rows_out': None}
+        return
+
+    opened = _open_stage.get()
+    parent = opened[1] if opened is not None and opened[0] is recorder else None
+    record = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stage': name,
+        'parent': parent['stage'] if parent is not None else None,
+        'depth': parent['depth'] + 1 if parent is not None else 0,
+        'rows_in': rows_in,
+        'rows_out': None,
+        'info': info or None,
+    }
+    tracing = recorder.trace_memory and _tracer is recorder
+    if tracing:
+        # Fold the peak so far into the parent before measuring this stage alone
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent['_peak'] = max(parent.get('_peak', 0), peak)
+        tracemalloc.reset_peak()
+        record['_base'] = current
+        record['_peak'] = current
+
+    token = _open_stage.set((recorder, record))
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['elapsed_s'] = time.perf_counter() - start
+        _open_stage.reset(token)
+        record['peak_mb'] = None
+        if tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            record['_peak'] = max(record['_peak'], peak)
+            record['peak_mb'] = (record['_peak'] - record['_base']) / (1 << 20)
+            if parent is not None:
+                parent['_peak'] = max(parent.get('_peak', 0), record['_peak'])
+        recorder._add({key: value for key, value in record.items() if not key.startswith('_')})
+
+
+def staged(name):
+    """
+    Decorator that measures every call of a function as one stage.
+
+    `rows_out` is the length of the returned value.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None and _checkpoint.get() is None:
+                return func(*args, **kwargs)
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = len(result) if hasattr(result, '__len__') else None
+                return result
+        return wrapper
+    return decorator
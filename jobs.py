@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrument import StageRecorder, checkpoint, recording
+from processing import process_parallel
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when the user cancelled it.
+    """
+
+
+# --- Background Job ---
+class Job:
+    """
+    One processing run executed in the background.
+
+    `status` moves from 'queued' to 'running' and ends as 'done', 'failed'
+    or 'cancelled'. `progress` (0-1) and `message` are updated while it runs.
+    """
+
+    def __init__(self, key, trace_memory=False):
+        self.key = key
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.result = None
+        self.error = None
+        self.notes = []
+        self.submitted = time.time()
+        self.finished = None
+        self.recorder = StageRecorder(trace_memory=trace_memory)
+        self._cancel = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """
+        Ask the job to stop; it ends at its next stage or task boundary.
+        """
+        self._cancel.set()
+        if self.status == 'queued':
+            self.message = 'Cancelling...'
+
+    def report(self, progress=None, message=None):
+        """
+        Update the progress of the job, raising `JobCancelled` if it was cancelled.
+        """
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if progress is not None:
+            self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+
+# --- Job Runner ---
+class JobRunner:
+    """
+    Runs processing jobs in a small thread pool shared by every session.
+
+    Jobs are keyed (e.g. by file hashes, option and parameters): submitting a
+    key that is already queued, running or done returns the existing job, so
+    reruns and other sessions asking for the same result share one run.
+    """
+
+    def __init__(self, max_workers=2, max_finished=16, results=None):
+        """
+        Parameters:
+            - max_workers: Number of jobs running at the same time.
+            - max_finished: Number of finished jobs kept for later lookups.
+            - results: Optional cache (e.g. an `LRUCache`) that receives the result of
+              every finished job under its key. The job then drops its own
+              reference, so results only take memory within the cache's bound;
+              a result too large for the cache stays on the job.
+        """
+        self.max_finished = max_finished
+        self.results = results
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the job submitted under `key`, or None.
+        """
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key, func, *args, trace_memory=False, **kwargs):
+        """
+        Run `func(job, *args, **kwargs)` in the background unless `key` already has a job.
+
+        Failed and cancelled jobs are replaced by a new run, and so are finished
+        jobs whose result was evicted from the `results` cache.
+
+        Returns:
+            - The (new or existing) Job.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status == 'done' and self.result(job) is None:
+                job = None
+            if job is not None and job.status in ('queued', 'running', 'done'):
+                self._jobs.move_to_end(key)
+                return job
+            job = Job(key, trace_memory=trace_memory)
+            self._jobs[key] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def result(self, job):
+        """
+        Return the result of a finished job (from the `results` cache if used), or None.
+        """
+        if job.result is not None or self.results is None:
+            return job.result
+        return self.results.get(job.key)
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if not job.active]
+        for key in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancelled:
+            job.status, job.message, job.finished = 'cancelled', 'Cancelled', time.time()
+            return
+        job.status, job.message = 'running', 'Starting'
+
+        def on_stage(name):
+            job.report(message=name)
+
+        try:
+            # Every stage boundary inside the job is a cancellation point
+            with recording(job.recorder), checkpoint(on_stage):
+                result = func(job, *args, **kwargs)
+            if self.results is not None:
+                self.results.put(job.key, result)
+            if self.results is None or job.key not in self.results:
+                job.result = result
+            job.status, job.progress, job.message = 'done', 1.0, 'Done'
+        except JobCancelled:
+            job.status, job.message = 'cancelled', 'Cancelled'
+        except Exception as e:
+            job.status, job.error, job.message = 'failed', e, f"Failed: {e}"
+        finally:
+            job.finished = time.time()
+
+
+# --- Processing Jobs ---
+def run_option_job(job, option, dataframes, filenames, parallel=False, workers=None, chunk_size=None, on_result=None,
+                   **kwargs):
+    """
+    Run a processing option with `process_parallel`, reporting progress to `job`.
+
+    Parameters:
+        - job: The running Job.
+        - option: One of `process_selected_files_1/2/3`.
+        - dataframes, filenames: Selected files (DataFrames or normalized tables).
+        - parallel: Run the tasks in a process pool; otherwise they run one by
+          one in the job thread.
+        - workers: Number of worker processes in parallel mode (default: number of CPUs).
+        - chunk_size: Split files with more respondents than this into tasks.
+        - on_result: Optional callable `on_result(filename, result)` called with the
+          output of every task (e.g. to aggregate it per file) before the merge.
+        - **kwargs: Parameters passed to the option (locations, year, price_file).
+
+    Returns:
+        - The same DataFrame as running the option over all files at once.
+    """
+    def report(done, total):
+        # Raises JobCancelled, which stops the run at the next finished task
+        job.report(done / total if total else 0.0, f"{done}/{total} tasks")
+        if done == total:
+            job.report(message='Merging')
+
+    return process_parallel(option, dataframes, filenames, workers=workers if parallel else 1,
+                            chunk_size=chunk_size, progress=report, on_result=on_result, **kwargs)
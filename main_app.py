@@ -1,12 +1,137 @@
 import streamlit as st
 import pandas as pd
 import json
+import hashlib
+import time
+from cache import LRUCache, file_digest, file_mtime
 from credentials import USER_CREDENTIALS
-from processing import load_json_files, process_selected_files_1, process_selected_files_2, process_selected_files_3 # process_selected_files_4
+from export import EXPORT_FORMATS, available_formats, export_bytes
+from incremental import respondent_fingerprints, update_incremental
+from instrument import StageRecorder, recording, stage
+from jobs import JobRunner, run_option_job
+from mongo_source import list_collections, load_mongo_collections, processing_fields
+from pivot import AGGREGATIONS, CROSSTAB_DIMENSIONS, PivotCube, event_crosstab, merge_crosstabs
+from preview import PAGE_SIZES, page_count, page_window, summarize
+from snapshot import load_snapshot, prune_snapshots, save_snapshot
+import os
+from processing import UNION_POLICIES, load_json_files, merge_partial_results, select_regions, source_label, union_respondents, process_selected_files_1, process_selected_files_2, process_selected_files_3, process_selected_files_4
 
 # --- price url 
 price_file = r"product_price_tag.csv"
 
+# --- Shared Cache for Parsed Uploads and Processing Results ---
+@st.cache_resource
+def get_cache():
+    # Shared by every rerun and session of this server process
+    return LRUCache(max_entries=32, max_bytes=2 << 30)
+
+
+@st.cache_resource
+def get_job_runner():
+    # Background processing jobs, shared (and deduplicated) across sessions
+    # Finished results live in the shared cache, within its size bound
+    return JobRunner(max_workers=2, results=get_cache())
+
+
+def get_digest(file):
+    # Hash each upload only once per session; reruns reuse the digest
+    digests = st.session_state.setdefault("file_digests", {})
+    upload_key = (file.name, file.size, getattr(file, "file_id", None))
+    if upload_key not in digests:
+        digests[upload_key] = file_digest(file)
+    return digests[upload_key]
+
+
+def load_mongo_collection(name, uri, database, locations, fields=None, progress=None):
+    # Region filter and projection run inside MongoDB; results arrive in cursor batches
+    return load_mongo_collections([name], uri=uri, database=database, locations=locations, fields=fields,
+                                  normalize=True, progress=progress)[name]
+
+
+def load_json_file(file, snapshot_key, progress=None):
+    # Uploads seen in an earlier session are read from their columnar snapshot;
+    # it holds every respondent, so changing the region prefilter does not parse the file again
+    with stage("load_snapshot", file=file.name) as record:
+        tables = load_snapshot(snapshot_key)
+        record["rows_out"] = len(tables["person"]) if tables is not None else None
+    if tables is not None:
+        return tables
+    # Normalize once into person/history tables shared by every processing option
+    tables = load_json_files([file], streaming=True, progress=progress, normalize=True).get(file.name)
+    if tables is not None:
+        with stage("save_snapshot", file=file.name):
+            save_snapshot(tables, snapshot_key)
+            prune_snapshots()
+    return tables
+
+
+# --- Stage Timings ---
+def get_recorder():
+    # One recorder per session; memory tracing is switched in the timings panel
+    recorder = st.session_state.setdefault("stage_recorder", StageRecorder())
+    recorder.trace_memory = st.session_state.get("trace_memory", False)
+    return recorder
+
+
+def recorded_export(recorder, df, fmt):
+    # Runs when the download is clicked, so the recorder is passed in explicitly
+    with recording(recorder), stage("export", rows_in=len(df), format=fmt):
+        return export_bytes(df, fmt)
+
+
+# --- Paginated Preview ---
+def show_page(df, key):
+    # Only the rows of the current page are serialized to the browser
+    col_size, col_page = st.columns(2)
+    page_size = col_size.selectbox("Rows per page", options=PAGE_SIZES, index=1, key=f"{key}_page_size")
+    pages = page_count(df, page_size)
+    page_key = f"{key}_page"
+    # Keep the page in range when the page size or the table changes
+    st.session_state[page_key] = min(st.session_state.get(page_key, 1), pages)
+    page = col_page.number_input(f"Page (1-{pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    st.caption(f"{len(df):,} rows × {len(df.columns)} columns")
+    with recording(get_recorder()), stage("render", rows_in=len(df), table=key) as record:
+        window = page_window(df, page, page_size)
+        record["rows_out"] = len(window)
+        st.dataframe(window)
+
+
+# --- Processed Results and Lazy Export ---
+def show_result(name, key):
+    # Show the stored result of an option if it was computed for the current selection
+    result = st.session_state.get("results", {}).get(name)
+    if result is None or result["key"] != key:
+        return
+    result_df = result["df"]
+    st.subheader(result["title"])
+    for note in result.get("notes", []):
+        st.caption(note)
+    show_page(result_df, f"{name}_result")
+
+    # The file is only encoded when the download button is clicked
+    fmt = st.selectbox(f"Export format: {result['label']}", options=available_formats(), key=f"{name}_export_format")
+    mime, extension = EXPORT_FORMATS[fmt]
+    st.download_button(
+        f"Download {fmt.upper()}: {result['label']}",
+        data=lambda recorder=get_recorder(): recorded_export(recorder, result_df, fmt),
+        file_name=f"{result['file_base']}.{extension}",
+        mime=mime,
+        on_click="ignore",
+        key=f"{name}_download",
+    )
+
+
+@st.fragment(run_every=1.0)
+def show_job_progress(name, key):
+    # Polls the background job; the whole page reruns once it has finished
+    job = get_job_runner().get(key)
+    if job is None or not job.active:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.message} ({time.time() - job.submitted:.0f}s)")
+    if st.button("Cancel", key=f"{name}_cancel"):
+        job.cancel()
+
+
 # --- Session State Management for Login ---
 def check_login():
     if "logged_in" not in st.session_state:
@@ -38,14 +163,68 @@ st.title("CLUE: JSON to CSV")
 st.write("JSON 파일을 필요에 맞는 형태로 추출(CSV) 하는 앱입니다.")
 st.write("공유받은 JSON 파일을 로드하신 후 아래 세부 선택 사항을 활용하여 데이터 전처리 후 사용하세요.")
 
-# Step 1: File Upload
-uploaded_files = st.file_uploader("Upload JSON files", type="json", accept_multiple_files=True)
+# Step 1: Data Source (JSON upload or MongoDB)
+data_source = st.radio("Data source", ["JSON upload", "MongoDB"], horizontal=True)
+uploaded_files = []
+mongo_collections = []
+if data_source == "MongoDB":
+    with st.expander("MongoDB connection", expanded=True):
+        mongo_uri = st.text_input("MongoDB URI", value="mongodb://localhost:27017", type="password")
+        mongo_db = st.text_input("Database", value="clue")
+        mongo_locations = st.multiselect("서버에서 미리 필터링할 지역", options=['KOR', 'US'], default=['KOR', 'US'])
+        # Options 1-3 only read these fields; Option 4 unites whole documents
+        mongo_full = st.checkbox("문서 전체 필드 가져오기 (Option 4용, 기본: Option 1-3에 필요한 필드만)", value=False)
+        mongo_fields = None if mongo_full else processing_fields()
+        try:
+            available_collections = list_collections(mongo_uri, mongo_db)
+        except Exception as e:
+            st.error(f"Could not connect to MongoDB: {e}")
+            available_collections = []
+        mongo_collections = st.multiselect("Collections", options=available_collections)
+        if st.button("Reload from MongoDB"):
+            st.session_state.mongo_reload = st.session_state.get("mongo_reload", 0) + 1
+else:
+    uploaded_files = st.file_uploader("Upload JSON files", type="json", accept_multiple_files=True)
+    upload_locations = st.multiselect("로딩 시 미리 필터링할 지역", options=['KOR', 'US'], default=['KOR', 'US'])
 filenames = [file.name for file in uploaded_files]
 
-if uploaded_files:
+if uploaded_files or mongo_collections:
     # Load JSON files into DataFrames
     st.subheader("Uploaded Files")
-    dataframes = load_json_files(uploaded_files)
+    progress_bar = st.progress(0.0, text="Loading JSON files...")
+
+    def report_progress(name, fraction):
+        progress_bar.progress(fraction, text=f"Loading {name}... {fraction:.0%}")
+
+    # Stream the top-level arrays record by record to keep memory bounded;
+    # uploads whose content was parsed before are served from the cache
+    cache = get_cache()
+    dataframes = {}
+    file_digests = {}
+    with recording(get_recorder()):
+        for file in uploaded_files:
+            # Uploads are parsed and snapshotted once per content; the region prefilter is applied afterwards
+            digest = get_digest(file)
+            tables = cache.get_or_compute(("json", digest), load_json_file, file, digest, progress=report_progress)
+            if tables is not None:
+                source_key = (digest, tuple(upload_locations))
+                file_digests[file.name] = hashlib.sha256(repr(source_key).encode("utf-8")).hexdigest()
+                filtered = cache.get(("json", file_digests[file.name]))
+                if filtered is None:
+                    filtered = select_regions(tables, upload_locations)
+                    if filtered is not tables:
+                        # Only a filtered copy needs its own entry; unfiltered tables are cached above
+                        cache.put(("json", file_digests[file.name]), filtered)
+                dataframes[file.name] = filtered
+        for name in mongo_collections:
+            # Collections have no upload to hash: key them by connection, filter and reload count
+            source_key = (mongo_uri, mongo_db, name, tuple(mongo_locations), mongo_fields is None,
+                          st.session_state.get("mongo_reload", 0))
+            file_digests[name] = hashlib.sha256(repr(source_key).encode("utf-8")).hexdigest()
+            dataframes[name] = cache.get_or_compute(
+                ("mongo", file_digests[name]), load_mongo_collection, name, mongo_uri, mongo_db,
+                mongo_locations, fields=mongo_fields, progress=report_progress)
+    progress_bar.empty()
 
     if dataframes:
         # Display Tabs for Uploaded Files
@@ -56,20 +235,28 @@ if uploaded_files:
         for i, tab in enumerate(tabs):
             with tab:
                 st.write(f"**Preview of {tab_names[i]}**")
-                st.dataframe(dataframes[tab_names[i]])  # Display DataFrame
+                tables = dataframes[tab_names[i]]
+                table_name = st.selectbox("Table", options=list(tables.keys()), key=f"preview_table_{i}")
+                with st.expander("Summary statistics"):
+                    # Computed once per file and table, then served from the cache
+                    st.dataframe(cache.get_or_compute(
+                        ("summary", file_digests[tab_names[i]], table_name), summarize, tables[table_name]))
+                show_page(tables[table_name], f"preview_{i}_{table_name}")
 
         # Step 2: Select Files for Processing
         st.subheader("Select Files for Processing")
-        selected_file = st.selectbox("Select a file to process", options=tab_names)
-        # selected_files = st.multiselect("Select files", options=tab_names, default=tab_names)
+        selected_files = st.multiselect("Select files to process", options=tab_names, default=tab_names[:1])
+
+        if selected_files:
+            selected_dataframes = [dataframes[file] for file in selected_files]
+            filenames = list(selected_files)
+            selected_digests = tuple(file_digests[file] for file in filenames)
 
-        if selected_file:
-            selected_dataframes = [dataframes[selected_file]] # [dataframes[file] for file in selected_files]
-            filenames = [selected_file]
-            # print(selected_file, filenames)
+            # extract the short source names for csv filenames
+            source_name = "+".join(file.split('_')[0] if '_' in file else file for file in filenames)
 
             # Step 3: Year Input and Processing Options
-            tab1, tab2 = st.tabs(["구매기록-년도 수정", "Processing Options"])
+            tab1, tab2, tab3 = st.tabs(["구매기록-년도 수정", "Processing Options", "Pivot Table"])
 
             with tab1:
                 st.subheader("지역 선택")
@@ -79,74 +266,226 @@ if uploaded_files:
                 year_input = st.number_input(
                     "Processing Option 2 세부 선택사항 입니다. 희망하는 구매기록 년도를 입력하세요. (default: 2010년)", min_value=1900, max_value=2100, value=2010)
                 st.info(f"Filtering data: {year_input}년도 이후 구매 데이터만 전처리합니다.")
-                
-                
+                st.subheader("병렬 처리")
+                parallel = st.checkbox("여러 CPU 코어로 파일(또는 응답자 묶음)을 병렬 처리합니다.", value=len(filenames) > 1)
+                chunk_size = st.number_input(
+                    "한 파일을 나누어 처리할 응답자 수 (0: 파일 단위)", min_value=0, value=0, step=10000, disabled=not parallel)
+                st.subheader("증분 처리")
+                incremental = st.checkbox(
+                    "같은 소스의 이전 결과를 재사용하고 추가/변경된 응답자만 다시 처리합니다. (병렬 처리 대신 사용)", value=False)
+                st.subheader("파일 합치기 (Option 4)")
+                union_policy = st.selectbox(
+                    "같은 소스(vendor_year)와 id의 응답자가 여러 파일에 다르게 있을 때 남길 기록을 선택하세요.",
+                    options=UNION_POLICIES,
+                    format_func={
+                        'last': "last: 나중 파일의 기록", 'first': "first: 먼저 나온 기록",
+                        'most_complete': "most_complete: 값이 가장 많이 채워진 기록", 'error': "error: 오류로 중단",
+                    }.get)
+                # The load-time region prefilter applies to Option 4 too
+                prefilter = mongo_locations if data_source == "MongoDB" else upload_locations
+                st.caption(f"로딩 시 지역 필터({', '.join(prefilter) or '없음'})를 통과한 응답자만 합쳐집니다. "
+                           "지역(region)이 없는 응답자는 KOR로 간주됩니다. 이력(history)은 남긴 기록의 것을 그대로 유지합니다.")
+
+            def crosstab_key(filename):
+                # Option 2 cross-tabs are kept per file, so any selection can be assembled from them
+                return ("crosstab", file_digests[filename], tuple(locations), year_input, file_mtime(price_file))
+
+            def keep_crosstabs(option, results):
+                # Runs in the job thread; results are (filename, partial result) pairs
+                if option is not process_selected_files_2:
+                    return
+                parts = {}
+                for filename, result in results:
+                    parts.setdefault(filename, []).append(event_crosstab(result))
+                for filename, crosstabs in parts.items():
+                    cache.put(crosstab_key(filename), merge_crosstabs(crosstabs))
+
+            def rebuild_crosstabs(result):
+                # Cross-tabs are evicted independently of the Option 2 result; rebuild the missing ones from it
+                if all(crosstab_key(filename) in cache for filename in filenames):
+                    return
+                labels = [source_label(process_selected_files_2, filename) for filename in filenames]
+                if len(set(labels)) == len(labels):
+                    for filename, label in zip(filenames, labels):
+                        if crosstab_key(filename) not in cache:
+                            cache.put(crosstab_key(filename), event_crosstab(result[result['source'] == label]))
+                else:
+                    # Files sharing a source cannot be told apart in the result, so keep one for the selection
+                    cache.put(("crosstab",) + option_keys["option2"], event_crosstab(result))
+
+            def selection_crosstab():
+                crosstabs = [cache.get(crosstab_key(filename)) for filename in filenames]
+                if all(crosstab is not None for crosstab in crosstabs):
+                    return merge_crosstabs(crosstabs)
+                return cache.get(("crosstab",) + option_keys["option2"])
+
+            def run_incremental(job, option, **kwargs):
+                # One stored result per source and parameters; a new wave only reprocesses changed ids
+                # Option 2 cross-tabs are updated from the reprocessed respondents' rows only
+                aggregate = (event_crosstab, merge_crosstabs) if option is process_selected_files_2 else None
+                partials = []
+                for done, (data, filename, digest) in enumerate(zip(selected_dataframes, filenames, selected_digests), start=1):
+                    state_key = ("incremental", option.__name__, source_label(option, filename), repr(sorted(kwargs.items())))
+                    fingerprints = cache.get_or_compute(("fingerprints", digest), respondent_fingerprints, data)
+                    result, state = update_incremental(
+                        option, data, filename, cache.get(state_key), fingerprints=fingerprints, aggregate=aggregate, **kwargs)
+                    cache.put(state_key, state)
+                    if aggregate is not None:
+                        cache.put(crosstab_key(filename), state['aggregate'])
+                    job.notes.append(f"{filename}: {state['stats']['processed']:,} respondents processed, "
+                                     f"{state['stats']['reused']:,} reused, {state['stats']['removed']:,} removed")
+                    job.report(done / len(filenames), f"{done}/{len(filenames)} files")
+                    partials.append(result)
+                return merge_partial_results(option, partials)
+
+            def run_union(job, policy):
+                result, stats = union_respondents(selected_dataframes, filenames, policy)
+                job.notes.append(f"{stats['rows']:,} rows united into {stats['kept']:,} respondents: "
+                                 f"{stats['duplicates']:,} duplicates dropped, {stats['conflicts']:,} with conflicting records")
+                return result
+
+            def run_option(job, option, **kwargs):
+                # Runs in a background job thread, so no Streamlit calls in here
+                if option is process_selected_files_4:
+                    return run_union(job, **kwargs)
+                if incremental:
+                    return run_incremental(job, option, **kwargs)
+                # Same output either way; the pool spreads files/respondent chunks over all cores
+                partials = []
+                result = run_option_job(job, option, selected_dataframes, filenames, parallel=parallel,
+                                        workers=os.cpu_count(), chunk_size=chunk_size or None,
+                                        on_result=lambda filename, part: partials.append((filename, part)), **kwargs)
+                keep_crosstabs(option, partials)
+                return result
+
+            # Results are kept per option so their export controls survive reruns
+            results = st.session_state.setdefault("results", {})
+            requested = st.session_state.setdefault("requested", {})
+            option_keys = {
+                "option1": ("option1", selected_digests, tuple(filenames), tuple(locations)),
+                "option2": ("option2", selected_digests, tuple(filenames), tuple(locations), year_input, file_mtime(price_file)),
+                "option3": ("option3", selected_digests, tuple(filenames), tuple(locations), file_mtime(price_file)),
+                "option4": ("option4", selected_digests, tuple(filenames), union_policy),
+            }
+            job_runner = get_job_runner()
+
+            def option_section(name, button_label, option, title, label, file_base, **kwargs):
+                # The button submits a background job; finished results are shared through the cache
+                key = option_keys[name]
+                entry = {"key": key, "title": title, "label": label, "file_base": file_base}
+                if st.button(button_label):
+                    requested[name] = key
+                    cached = cache.get(key)
+                    if cached is not None:
+                        if option is process_selected_files_2:
+                            rebuild_crosstabs(cached)
+                        results[name] = dict(entry, df=cached)
+                    else:
+                        job_runner.submit(key, run_option, option, trace_memory=get_recorder().trace_memory, **kwargs)
+
+                job = job_runner.get(key) if requested.get(name) == key else None
+                if job is not None:
+                    if job.active:
+                        show_job_progress(name, key)
+                    elif job.status == "done" and results.get(name, {}).get("key") != key:
+                        result_df = job_runner.result(job)
+                        if result_df is None:
+                            st.info(f"{label} result was evicted from the cache; run it again.")
+                        else:
+                            get_recorder().extend(job.recorder.records)
+                            results[name] = dict(entry, df=result_df, notes=list(job.notes))
+                    elif job.status == "failed":
+                        st.error(f"{label} failed: {job.error}")
+                    elif job.status == "cancelled":
+                        st.info(f"{label} was cancelled.")
+                show_result(name, key)
+
             with tab2:
                 st.subheader("Processing Options")
                 # Process Option 1
-                if st.button("Process Option 1: ID별 DEMOGRAPHY"):
-                    # Process demographic data
-                    demo_df = process_selected_files_1(selected_dataframes, filenames, locations=locations)
-                    st.subheader("Processed DataFrame ID별 DEMOGRAPHY")
-                    st.dataframe(demo_df)
-                    
-                    # extract the short source name for csv filename 
-                    source_name = selected_file.split('_')[0] if '_' in selected_file else selected_file
-                    export_filename = f"{source_name}_processed_demographics.csv"
-
-                    # Download the DataFrame as a CSV
-                    csv = demo_df.to_csv(index=False, encoding='utf-8-sig')
-                    st.download_button(
-                        label="Download CSV: Option 1",
-                        data=csv,
-                        file_name=export_filename,
-                        mime="text/csv"
-                    )
+                option_section(
+                    "option1", "Process Option 1: ID별 DEMOGRAPHY", process_selected_files_1,
+                    title="Processed DataFrame ID별 DEMOGRAPHY", label="Option 1",
+                    file_base=f"{source_name}_processed_demographics", locations=locations)
 
                 # Process Option 2
-                if st.button(f"Process Option 2: ID별 구매기록-{year_input}"):
-                    result_df = process_selected_files_2(
-                        selected_dataframes, filenames, year=year_input, locations=locations, price_file=price_file)
-                    st.subheader(f"Processed DataFrame: ID별 구매기록-{year_input}")
-                    st.dataframe(result_df)
-
-                    # extract the short source name for csv filename 
-                    source_name = selected_file.split(
-                        '_')[0] if '_' in selected_file else selected_file
-                    
-                    # Convert DataFrame to CSV with utf-8-sig encoding
-                    csv = result_df.to_csv(index=False, encoding='utf-8-sig')
-                    
-                    st.download_button(
-                        "Download CSV: Option 2",
-                        data=csv,
-                        file_name=f"processed_data_2_purchase_listup_{source_name}_{year_input}.csv",
-                        mime="text/csv"
-                    )
+                option_section(
+                    "option2", f"Process Option 2: ID별 구매기록-{year_input}", process_selected_files_2,
+                    title=f"Processed DataFrame: ID별 구매기록-{year_input}", label="Option 2",
+                    file_base=f"processed_data_2_purchase_listup_{source_name}_{year_input}",
+                    year=year_input, locations=locations, price_file=price_file)
 
                 # Process Option 3
-                if st.button(f"Process Option 3: ID별 라이프이벤트+구매기록 {locations}"):
-                    result_df = process_selected_files_3(
-                        selected_dataframes, filenames, locations=locations, price_file=price_file)
-                    st.subheader(f"Processed DataFrame: ID별 라이프이벤트+구매기록 {locations}")
-                    st.dataframe(result_df)
-                    
-                    source_name = selected_file.split(
-                        '_')[0] if '_' in selected_file else selected_file
-                    
-                    csv = result_df.to_csv(index=False, encoding='utf-8-sig')
-                    st.download_button("Download CSV: Option 3", csv, f"processed_data_3_{source_name}_lifeevent_purch_listup.csv", "text/csv")
-
-                # # Process Option 4
-                # if st.button("Process Option 4"):
-                #     result_df = process_selected_files_4(selected_dataframes)
-                #     st.subheader("Processed DataFrame (Option 4)")
-                #     st.dataframe(result_df)
-                #     csv = result_df.to_csv(index=False, encoding='utf-8-sig')
-                #     st.download_button("Download Processed CSV (Option 4)", csv, "processed_data_4.csv", "text/csv")
+                option_section(
+                    "option3", f"Process Option 3: ID별 라이프이벤트+구매기록 {locations}", process_selected_files_3,
+                    title=f"Processed DataFrame: ID별 라이프이벤트+구매기록 {locations}", label="Option 3",
+                    file_base=f"processed_data_3_{source_name}_lifeevent_purch_listup",
+                    locations=locations, price_file=price_file)
+
+                # Process Option 4
+                option_section(
+                    "option4", "Process Option 4: 파일 합치기 (중복 응답자 제거)", process_selected_files_4,
+                    title=f"Processed DataFrame: 파일 합치기 ({union_policy})", label="Option 4",
+                    file_base=f"processed_data_4_{source_name}_union", policy=union_policy)
+
+            with tab3:
+                st.subheader("Pivot Table")
+                # Pivot over the Option 2/3 results computed for the current selection
+                pivot_sources = {
+                    results[name]["label"]: results[name]
+                    for name in ("option2", "option3")
+                    if name in results and results[name]["key"] == option_keys[name]
+                }
+                # Purchase x life event cross-tab, assembled from the per-file aggregates of earlier Option 2 runs
+                crosstab = selection_crosstab()
+                if crosstab is None and "Option 2" in pivot_sources:
+                    rebuild_crosstabs(pivot_sources["Option 2"]["df"])
+                    crosstab = selection_crosstab()
+                if crosstab is not None:
+                    pivot_sources["Option 2 cross-tab: event × detail × ages × year"] = {
+                        "key": ("crosstab",) + option_keys["option2"],
+                        "df": crosstab,
+                        # 'count' of spend is the priced purchases; 'purchases' counts every purchase
+                        "measures": {
+                            "spend": {"dimensions": CROSSTAB_DIMENSIONS, "value": "spend", "counts": "priced"},
+                            "purchases": {"dimensions": CROSSTAB_DIMENSIONS, "value": "count", "counts": "count"},
+                        },
+                    }
+                if not pivot_sources:
+                    st.info("Processing Options 탭에서 Option 2 또는 3을 먼저 실행하세요.")
+                else:
+                    pivot_label = st.selectbox("Result", options=list(pivot_sources))
+                    pivot_result = pivot_sources[pivot_label]
+                    measures = pivot_result.get("measures", {"price": {}})
+                    pivot_measure = next(iter(measures))
+                    if len(measures) > 1:
+                        pivot_measure = st.radio("Measure", options=list(measures), horizontal=True, key="pivot_measure")
+                    # One cube per result and measure; every re-pivot is rolled up from cached aggregates
+                    cube_key = ("pivot", pivot_result["key"], pivot_measure)
+                    cube = cache.get_or_compute(cube_key, PivotCube, pivot_result["df"], **measures[pivot_measure])
+                    pivot_rows = st.multiselect("Rows", options=cube.dimensions, default=cube.dimensions[:1], key="pivot_rows")
+                    pivot_columns = st.multiselect(
+                        "Columns", options=[d for d in cube.dimensions if d not in pivot_rows], key="pivot_columns")
+                    # Every purchase is counted once, so only its sum is meaningful
+                    aggregations = ['sum'] if pivot_measure == "purchases" else AGGREGATIONS
+                    pivot_agg = st.radio(f"Value: {pivot_measure}", options=aggregations, horizontal=True, key="pivot_agg")
+                    st.dataframe(cube.pivot(pivot_rows, pivot_columns, agg=pivot_agg))
+                    # The pivot may have aggregated another cube; charge the cache for it
+                    cache.resize(cube_key)
         else:
             st.warning("Please select at least one file for processing.")
     else:
         st.error("No valid JSON files were loaded.")
 else:
-    st.info("Upload JSON files to begin.")
+    st.info("Upload JSON files (or select MongoDB collections) to begin.")
+
+# --- Stage Timings Panel ---
+with st.expander("Performance: stage timings"):
+    st.checkbox("Trace peak memory per stage (slower)", key="trace_memory")
+    recorder = get_recorder()
+    st.dataframe(recorder.to_frame())
+    st.download_button("Download timings (JSON)", data=recorder.to_json(), file_name="stage_timings.json",
+                       mime="application/json", on_click="ignore")
+    if st.button("Clear timings"):
+        recorder.clear()
+        st.rerun()
@@ -0,0 +1,154 @@
+import threading
+
+from processing import DEFAULT_REGION, records_to_dataframe, records_to_tables
+
+try:
+    import pymongo
+except ImportError:  # Optional dependency: only needed for the MongoDB source
+    pymongo = None
+
+# --- Fields read by each processing option (top-level projection) ---
+OPTION_FIELDS = {
+    1: ['id', 'gender', 'marriage', 'age', 'ages', 'occupation_name', 'income', 'brand_name', 'education', 'region'],
+    2: ['id', 'age', 'ages', 'birth', 'region', 'purchase', 'education', 'residence', 'interior', 'children', 'pet', 'vehicle'],
+    3: ['id', 'age', 'birth', 'marriage', 'region', 'purchase', 'education', 'job', 'residence', 'interior', 'children', 'pet', 'vehicle'],
+}
+
+
+def processing_fields(options=(1, 2, 3)):
+    """
+    Return the sorted union of the fields read by the given processing options.
+    """
+    return sorted(set().union(*(OPTION_FIELDS[option] for option in options)))
+
+# --- Pooled Clients ---
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(uri, **kwargs):
+    """
+    Return a shared MongoClient for a connection URI.
+
+    MongoClient keeps its own connection pool and is thread-safe, so one
+    instance per URI is reused by every rerun and session.
+
+    Parameters:
+        - uri: MongoDB connection string.
+        - **kwargs: Extra MongoClient options used when the client is created.
+
+    Raises:
+        - ImportError: If pymongo is not installed.
+    """
+    if pymongo is None:
+        raise ImportError("The MongoDB source requires the 'pymongo' package (pip install pymongo).")
+    with _clients_lock:
+        if uri not in _clients:
+            _clients[uri] = pymongo.MongoClient(uri, **kwargs)
+        return _clients[uri]
+
+
+def build_pipeline(locations=None, min_year=None, fields=None):
+    """
+    Build the aggregation pipeline that filters and projects respondents server-side.
+
+    Parameters:
+        - locations: Regions to keep (e.g. ['KOR']); None keeps every region.
+          Documents without a region count as `DEFAULT_REGION`, as in `filter_records`.
+        - min_year: Drop purchase history entries before this year; None keeps all.
+          Same predicate as `filter_records` (see there for which options use it).
+        - fields: Top-level fields to return (see `OPTION_FIELDS`); None returns all.
+
+    Returns:
+        - A list of aggregation stages.
+    """
+    pipeline = []
+    if locations is not None:
+        match = {'region': {'$in': list(locations)}}
+        if DEFAULT_REGION in locations:
+            # {'region': None} matches documents without the field and with null
+            match = {'$or': [match, {'region': None}]}
+        pipeline.append({'$match': match})
+    if min_year is not None:
+        pipeline.append({'$addFields': {'purchase.history': {'$filter': {
+            'input': {'$ifNull': ['$purchase.history', []]},
+            'as': 'hist',
+            'cond': {'$gte': ['$$hist.year', min_year]},
+        }}}})
+    projection = {field: 1 for field in fields or []}
+    projection['_id'] = 0
+    pipeline.append({'$project': projection})
+    return pipeline
+
+
+def iter_mongo_records(collection, pipeline, batch_size=5000, progress=None):
+    """
+    Yield respondent documents from an aggregation, fetched in batches.
+
+    Parameters:
+        - collection: pymongo (or mongomock) collection.
+        - pipeline: Aggregation pipeline from `build_pipeline`.
+        - batch_size: Number of documents per cursor batch.
+        - progress: Optional callable receiving the fraction (0-1) of documents read.
+    """
+    total = None
+    if progress is not None:
+        match = pipeline[0]['$match'] if pipeline and '$match' in pipeline[0] else {}
+        total = collection.count_documents(match)
+
+    cursor = collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+    try:
+        for count, record in enumerate(cursor, start=1):
+            yield record
+            if total and count % batch_size == 0:
+                progress(min(count / total, 1.0))
+    finally:
+        cursor.close()
+    if progress is not None:
+        progress(1.0)
+
+
+def load_mongo_collections(collections, uri="mongodb://localhost:27017", database="clue", locations=None,
+                           min_year=None, fields=None, batch_size=5000, normalize=False, client=None, progress=None):
+    """
+    Load respondent collections from MongoDB, like `load_json_files` does for uploads.
+
+    Region/year filters and field projections run inside MongoDB, so excluded
+    respondents and fields are never sent to the app.
+
+    Parameters:
+        - collections: Names of the collections to load (used as "filenames").
+        - uri: MongoDB connection string (ignored if `client` is given).
+        - database: Database name.
+        - locations, min_year, fields: Server-side filters, see `build_pipeline`.
+        - batch_size: Cursor batch size and DataFrame chunk size.
+        - normalize: Return the tables of `normalize_survey` instead of DataFrames.
+        - client: Existing MongoClient (e.g. `mongomock.MongoClient()` in tests).
+        - progress: Optional callable `progress(collection, fraction)`.
+
+    Returns:
+        - A dictionary mapping each collection name to its DataFrame (or normalized tables).
+    """
+    client = client if client is not None else get_client(uri)
+    db = client[database]
+    pipeline = build_pipeline(locations=locations, min_year=min_year, fields=fields)
+
+    dataframes = {}
+    for name in collections:
+        on_progress = None
+        if progress is not None:
+            on_progress = lambda fraction, name=name: progress(name, fraction)
+        records = iter_mongo_records(db[name], pipeline, batch_size=batch_size, progress=on_progress)
+        if normalize:
+            dataframes[name] = records_to_tables(records, batch_size=batch_size)
+        else:
+            dataframes[name] = records_to_dataframe(records, batch_size=batch_size)
+    return dataframes
+
+
+def list_collections(uri="mongodb://localhost:27017", database="clue", client=None):
+    """
+    Return the sorted collection names of a database.
+    """
+    client = client if client is not None else get_client(uri)
+    return sorted(client[database].list_collection_names())
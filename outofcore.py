@@ -0,0 +1,303 @@
+"""
+Out-of-core execution of processing Options 1-3 for files larger than memory.
+
+Respondents are streamed from the JSON file in bounded batches; every batch is
+processed on its own and its (already sorted) output is spilled to disk as a
+sorted run. The runs are then combined with an external merge on the option's
+sort keys, a block of rows at a time, so peak memory depends on the batch and
+block sizes rather than on the size of the input:
+
+    python outofcore.py --option 2 --year 2010 --locations KOR --output result.csv big_export.json
+"""
+import argparse
+import gzip
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+
+from instrument import stage
+from processing import (
+    _result_sort,
+    filter_records,
+    iter_json_records,
+    normalize_survey,
+    process_selected_files_1,
+    process_selected_files_2,
+    process_selected_files_3,
+)
+
+OPTIONS = {1: process_selected_files_1, 2: process_selected_files_2, 3: process_selected_files_3}
+
+
+# --- Sorted Runs on Disk ---
+def _plain(df):
+    """
+    Turn categorical columns into plain values, as `merge_partial_results` does
+    before combining partial outputs.
+    """
+    return df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+
+
+def write_run(df, path, block_rows=10000):
+    """
+    Spill a sorted DataFrame to disk as a sequence of pickled row blocks.
+
+    Returns:
+        - The number of rows written.
+    """
+    with open(path, 'wb') as file:
+        for start in range(0, len(df), block_rows):
+            pickle.dump(df.iloc[start:start + block_rows], file, protocol=pickle.HIGHEST_PROTOCOL)
+    return len(df)
+
+
+def iter_run(path):
+    """
+    Yield the row blocks of a run written by `write_run`, one at a time.
+    """
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+def _sort_keys(block, sort_keys):
+    """
+    Return one comparable key tuple per row, placing missing values last like
+    `sort_values(na_position='last')`.
+    """
+    columns = []
+    for key in sort_keys:
+        values = block[key]
+        missing = values.isna().to_numpy()
+        columns.append([(1, 0) if na else (0, value) for na, value in zip(missing, values.tolist())])
+    return list(zip(*columns))
+
+
+def _keyed_rows(run, blocks, sort_keys):
+    """
+    Yield `(key, run, block, position)` for every row of a run, loading one block
+    at a time into `blocks` so the merge can gather the rows afterwards.
+    """
+    for number, block in enumerate(blocks):
+        yield from ((key, run, number, position) for position, key in enumerate(_sort_keys(block, sort_keys)))
+
+
+def merge_runs(paths, sort_keys, chunk_rows=10000):
+    """
+    Merge sorted runs into one sorted stream of DataFrame chunks.
+
+    The merge is stable: rows with equal keys come out in run order, then in
+    their order within the run, which is the order `merge_partial_results`
+    produces for the same partial outputs.
+
+    Parameters:
+        - paths: Run files written by `write_run`, in file/respondent order.
+        - sort_keys: Columns the runs are sorted on.
+        - chunk_rows: Number of rows per yielded chunk.
+
+    Yields:
+        - DataFrame chunks of the merged result (categoricals as plain values).
+    """
+    loaded = {}  # (run, block) -> DataFrame, dropped once every row was emitted
+
+    def tracked(run, path):
+        for number, block in enumerate(iter_run(path)):
+            loaded[(run, number)] = _plain(block)
+            yield loaded[(run, number)]
+
+    streams = [_keyed_rows(run, tracked(run, path), sort_keys) for run, path in enumerate(paths)]
+    pending = []
+
+    def flush():
+        # Gather the pending rows block by block, then restore the merged order
+        order = pd.DataFrame(pending, columns=['run', 'block', 'position'])
+        parts, positions = [], []
+        for (run, number), group in order.groupby(['run', 'block'], sort=False):
+            parts.append(loaded[(run, number)].iloc[group['position'].to_numpy()])
+            positions.append(group.index.to_numpy())
+        chunk = pd.concat(parts, ignore_index=True).iloc[np.argsort(np.concatenate(positions), kind='stable')]
+        # Blocks before the last one emitted from each run are fully consumed
+        last = order.groupby('run')['block'].max().to_dict()
+        for run, number in list(loaded):
+            if number < last.get(run, -1):
+                del loaded[(run, number)]
+        pending.clear()
+        return chunk.reset_index(drop=True)
+
+    # heapq.merge is stable, and `run` breaks ties between equal keys
+    for key, run, number, position in heapq.merge(*streams):
+        pending.append((run, number, position))
+        if len(pending) >= chunk_rows:
+            yield flush()
+    if pending:
+        yield flush()
+
+
+def reduce_runs(paths, sort_keys, workdir, fan_in=16, block_rows=10000):
+    """
+    Merge consecutive groups of runs into longer runs until at most `fan_in` are left.
+
+    Keeps the number of blocks held in memory by the final merge bounded. Merging
+    consecutive runs keeps the merge stable.
+
+    Returns:
+        - The paths of the remaining runs, in order.
+    """
+    level = 0
+    while len(paths) > fan_in:
+        level += 1
+        merged = []
+        for start in range(0, len(paths), fan_in):
+            group = paths[start:start + fan_in]
+            if len(group) == 1:
+                merged.extend(group)
+                continue
+            path = os.path.join(workdir, f"pass{level}-{len(merged):06d}.pkl")
+            with open(path, 'wb') as file:
+                for chunk in merge_runs(group, sort_keys, chunk_rows=block_rows):
+                    pickle.dump(chunk, file, protocol=pickle.HIGHEST_PROTOCOL)
+            for used in group:
+                os.remove(used)
+            merged.append(path)
+        paths = merged
+    return paths
+
+
+# --- Out-of-Core Processing ---
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_out_of_core(option, file_paths, batch_size=5000, block_rows=10000, fan_in=16, spill_dir=None,
+                     progress=None, **kwargs):
+    """
+    Run a processing option over JSON files without loading them into memory.
+
+    Parameters:
+        - option: One of `process_selected_files_1/2/3`.
+        - file_paths: Paths of JSON files holding a top-level array of respondents.
+        - batch_size: Number of respondents processed (and held in memory) at a time.
+        - block_rows: Number of rows per spilled block and per yielded chunk.
+        - fan_in: Maximum number of runs merged at once; more runs are first
+          merged in extra passes over the disk.
+        - spill_dir: Directory for the temporary runs (default: the system temp directory).
+        - progress: Optional callable `progress(filename, fraction)` called while reading.
+        - **kwargs: Parameters passed to the option (locations, year, price_file).
+
+    Yields:
+        - DataFrame chunks that, concatenated, equal the serial result of the
+          option over all files (categoricals are returned as plain values).
+    """
+    sort_keys, _ = _result_sort(option)
+    locations = kwargs.get('locations')
+    # Purchase-year prefilter only for the options that use it (see `filter_records`)
+    min_year = kwargs.get('year', 2010) if option is process_selected_files_2 else None
+    workdir = tempfile.mkdtemp(prefix='outofcore-', dir=spill_dir)
+    try:
+        paths = []
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            on_progress = None
+            if progress is not None:
+                on_progress = lambda fraction, name=filename: progress(name, fraction)
+            with open(file_path, 'rb') as file:
+                records = filter_records(iter_json_records(file, progress=on_progress),
+                                         locations=locations, min_year=min_year)
+                for batch in _batches(records, batch_size):
+                    with stage('outofcore.batch', rows_in=len(batch), file=filename) as record:
+                        result = option([normalize_survey(pd.DataFrame(batch))], [filename], **kwargs)
+                        record['rows_out'] = len(result)
+                    if len(result):
+                        path = os.path.join(workdir, f"run{len(paths):06d}.pkl")
+                        write_run(result, path, block_rows)
+                        paths.append(path)
+                    del batch, result
+
+        if not paths:
+            yield option([], [])
+            return
+        with stage('outofcore.merge', runs=len(paths)):
+            paths = reduce_runs(paths, sort_keys, workdir, fan_in=fan_in, block_rows=block_rows)
+            yield from merge_runs(paths, sort_keys, chunk_rows=block_rows)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def process_out_of_core(option, file_paths, **kwargs):
+    """
+    Return the result of `iter_out_of_core` as one DataFrame (with the option's dtypes).
+
+    Only the output is held in memory; use `write_out_of_core` when it does not fit either.
+    """
+    _, finalize = _result_sort(option)
+    chunks = list(iter_out_of_core(option, file_paths, **kwargs))
+    merged = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+    if finalize is not None:
+        return finalize(merged)
+    return merged.infer_objects()
+
+
+def write_out_of_core(option, file_paths, output, **kwargs):
+    """
+    Stream the result of `iter_out_of_core` into a CSV (or .csv.gz) file.
+
+    Like the app's CSV export, the file starts with a UTF-8 byte order mark so
+    Excel opens the Korean text correctly.
+
+    Returns:
+        - The number of rows written.
+    """
+    _, finalize = _result_sort(option)
+    rows = 0
+    with ExitStack() as stack:
+        if output.endswith('.gz'):
+            file = stack.enter_context(gzip.open(output, 'wb'))
+        else:
+            file = stack.enter_context(open(output, 'wb'))
+        for chunk in iter_out_of_core(option, file_paths, **kwargs):
+            if finalize is not None:
+                chunk = finalize(chunk)
+            text = chunk.to_csv(index=False, header=rows == 0)
+            file.write(text.encode('utf-8-sig' if rows == 0 else 'utf-8'))
+            rows += len(chunk)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a processing option over JSON files larger than memory.")
+    parser.add_argument('files', nargs='+', help="JSON files holding a top-level array of respondents.")
+    parser.add_argument('--option', type=int, choices=sorted(OPTIONS), required=True)
+    parser.add_argument('--output', required=True, help="Result file (.csv or .csv.gz).")
+    parser.add_argument('--locations', nargs='+', default=['KOR'])
+    parser.add_argument('--year', type=int, default=2010, help="Purchase year filter of Option 2.")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Respondents processed at a time.")
+    parser.add_argument('--spill-dir', default=None, help="Directory for temporary sorted runs.")
+    args = parser.parse_args(argv)
+
+    option = OPTIONS[args.option]
+    kwargs = {'locations': args.locations}
+    if option is process_selected_files_2:
+        kwargs['year'] = args.year
+    rows = write_out_of_core(option, args.files, args.output, batch_size=args.batch_size,
+                             spill_dir=args.spill_dir, **kwargs)
+    print(f"Wrote {rows} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
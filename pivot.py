@@ -0,0 +1,221 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- Pivot Dimensions and Aggregations ---
+# Columns of the Option 2/3 outputs that can be used as pivot rows/columns
+PIVOT_DIMENSIONS = ['country', 'region', 'source', 'ages', 'age', 'year', 'header', 'detail', 'brand', 'event']
+AGGREGATIONS = ['sum', 'mean', 'count']
+
+
+def _encode(series):
+    """
+    Factorize a column into integer codes ordered like its sorted labels.
+
+    Missing values get the last code. Columns mixing types that cannot be
+    compared (e.g. Option 3 `detail`) are ordered by their string form.
+
+    Returns:
+        - (codes, labels): int64 codes and the Index of labels they refer to.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    labels = pd.Index(uniques, dtype=object)
+    try:
+        order = np.argsort(labels.to_numpy(), kind='stable')
+    except TypeError:
+        order = np.argsort(labels.astype(str).to_numpy(), kind='stable')
+    rank = np.empty(len(order), dtype='int64')
+    rank[order] = np.arange(len(order))
+    codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], len(order)).astype('int64')
+    labels = labels[order]
+    if (codes == len(order)).any():
+        labels = labels.append(pd.Index([np.nan], dtype=object))
+    return codes, labels
+
+
+class PivotCube:
+    """
+    Pre-aggregated sums and counts of a value column over categorical codes.
+
+    The table is encoded once into integer codes. A cube is aggregated only
+    for the dimension sets that are actually pivoted, rolled up from the
+    smallest cached cube that contains them (or from the coded table), so
+    re-pivoting never goes back to the full table and high-cardinality
+    dimensions (age, detail, brand) cost nothing until they are used.
+    """
+
+    def __init__(self, df, dimensions=None, value='price', counts=None, max_cubes=32):
+        """
+        Parameters:
+            - df: Processed output (Option 2 or 3), or an already aggregated table.
+            - dimensions: Candidate pivot dimensions (default: `PIVOT_DIMENSIONS`).
+            - value: Numeric column aggregated by the pivots.
+            - counts: For an aggregated table (e.g. `event_crosstab`), the column
+              holding how many values each `value` sum adds up.
+            - max_cubes: Number of aggregated cubes kept (least recently used are dropped).
+        """
+        self.dimensions = [d for d in (dimensions or PIVOT_DIMENSIONS) if d in df.columns]
+        self.value = value
+        self.max_cubes = max_cubes
+        self.labels = {}
+        self._lock = threading.Lock()
+
+        codes = {}
+        for dimension in self.dimensions:
+            dimension_codes, self.labels[dimension] = _encode(df[dimension])
+            codes[dimension] = dimension_codes.astype('int32')
+        values = pd.to_numeric(df[value], errors='coerce').to_numpy(dtype='float64')
+        table = pd.DataFrame(codes, index=pd.RangeIndex(len(df)))
+        table['sum'] = np.nan_to_num(values)
+        if counts is None:
+            table['count'] = (~np.isnan(values)).astype('int64')
+        else:
+            table['count'] = df[counts].to_numpy(dtype='int64')
+        self._table = table
+        self._cubes = {}
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory held by the coded table, the cached cubes and the labels.
+        """
+        with self._lock:
+            frames = [self._table] + list(self._cubes.values())
+            size = sum(int(frame.memory_usage(index=False, deep=True).sum()) for frame in frames)
+        return size + sum(int(labels.memory_usage(deep=True)) for labels in self.labels.values())
+
+    def __sizeof__(self):
+        # Lets size-bounded caches (see `cache.estimate_size`) account for the cube;
+        # cubes aggregated after it was cached are charged with `LRUCache.resize`
+        return object.__sizeof__(self) + self.nbytes
+
+    def cube(self, dimensions):
+        """
+        Return the cube aggregated over exactly `dimensions` (cached).
+
+        Parameters:
+            - dimensions: Subset of the cube's dimensions.
+
+        Returns:
+            - A DataFrame of dimension codes with 'sum' and 'count' columns.
+        """
+        key = frozenset(dimensions)
+        unknown = key - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown pivot dimensions: {sorted(unknown)}")
+        with self._lock:
+            if key in self._cubes:
+                self._cubes[key] = self._cubes.pop(key)  # Most recently used last
+                return self._cubes[key]
+            # Roll up from the smallest cached cube that has every requested dimension
+            parents = [cube for dims, cube in self._cubes.items() if key <= dims]
+            parent = min(parents, key=len) if parents else self._table
+            if key:
+                cube = parent.groupby(sorted(key), sort=False)[['sum', 'count']].sum().reset_index()
+            else:
+                cube = parent[['sum', 'count']].sum().to_frame().T
+            self._cubes[key] = cube
+            while len(self._cubes) > self.max_cubes:
+                del self._cubes[next(iter(self._cubes))]
+            return cube
+
+    def pivot(self, rows=(), columns=(), agg='sum'):
+        """
+        Pivot the value column by the given row and column dimensions.
+
+        Parameters:
+            - rows: Dimensions shown as rows.
+            - columns: Dimensions shown as columns.
+            - agg: 'sum', 'mean' or 'count' of the value column.
+
+        Returns:
+            - A DataFrame with one row per row-label combination and one column
+              per column-label combination (NaN where a combination never occurs).
+        """
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {agg}")
+        rows, columns = list(rows), list(columns)
+        cube = self.cube(rows + columns)
+        if agg == 'sum':
+            values = cube['sum']
+        elif agg == 'count':
+            values = cube['count']
+        else:
+            values = cube['sum'] / cube['count'].where(cube['count'] > 0)
+
+        if not rows and not columns:
+            return pd.DataFrame({f"{self.value}_{agg}": values.to_numpy()})
+
+        dims = rows + columns
+        result = cube[dims].assign(_value=values.to_numpy()).sort_values(dims)
+        for dimension in dims:
+            result[dimension] = self.labels[dimension].take(result[dimension].to_numpy())
+        result = result.set_index(dims)['_value']
+        result.name = f"{self.value}_{agg}"
+        if not rows:
+            return result.to_frame().T
+        if columns:
+            # Codes were sorted above, so unstacking keeps label order
+            return result.unstack(columns, sort=False)
+        return result.to_frame()
+
+
+# --- Purchase by Life Event Cross-Tabs ---
+# Dimensions of the precomputed Option 2 cross-tab
+CROSSTAB_DIMENSIONS = ['event', 'detail', 'ages', 'year']
+
+
+def event_crosstab(df):
+    """
+    Aggregate an Option 2 output into purchase counts and spend per
+    `event` x `detail` x `ages` x `year`.
+
+    Every purchase is counted, including those without a life event in the
+    same year (`event` 'no'), so the cross-tab adds up to the whole result.
+
+    Cross-tabs of disjoint parts of the data (files, respondent chunks) are
+    combined with `merge_crosstabs`, so they can be kept per file and merged
+    on demand instead of being recomputed from the full purchase table.
+
+    Returns:
+        - A DataFrame with the dimensions and the columns 'count' (purchases),
+          'priced' (purchases with a known price) and 'spend' (sum of prices).
+    """
+    columns = CROSSTAB_DIMENSIONS + ['count', 'priced', 'spend']
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    price = pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype='float64')
+    table = pd.DataFrame({dimension: df[dimension].to_numpy(dtype=object) for dimension in CROSSTAB_DIMENSIONS})
+    table['count'] = 1
+    table['priced'] = (~np.isnan(price)).astype('int64')
+    table['spend'] = np.nan_to_num(price)
+    return table.groupby(CROSSTAB_DIMENSIONS, dropna=False, sort=False).sum().reset_index()[columns]
+
+
+def merge_crosstabs(crosstabs, removed=()):
+    """
+    Combine cross-tabs of disjoint data (e.g. one per file) into one.
+
+    Parameters:
+        - crosstabs: Cross-tabs to add up.
+        - removed: Cross-tabs of rows that are no longer part of the data (e.g.
+          the previous rows of reprocessed respondents); they are subtracted,
+          and groups left without purchases are dropped.
+
+    Returns:
+        - The combined cross-tab.
+    """
+    parts = [crosstab for crosstab in crosstabs if not crosstab.empty]
+    removed = [crosstab for crosstab in removed if not crosstab.empty]
+    if not parts:
+        return event_crosstab(pd.DataFrame())
+    if len(parts) == 1 and not removed:
+        return parts[0]
+    measures = ['count', 'priced', 'spend']
+    negated = [crosstab.assign(**{measure: -crosstab[measure] for measure in measures}) for crosstab in removed]
+    merged = pd.concat(parts + negated, ignore_index=True)
+    merged = merged.groupby(CROSSTAB_DIMENSIONS, dropna=False, sort=False).sum().reset_index()
+    if removed:
+        merged = merged[merged['count'] > 0].reset_index(drop=True)
+    return merged
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+# --- Preview Paging ---
+PAGE_SIZES = [50, 100, 500, 1000]
+
+
+def page_count(df, page_size):
+    """
+    Return the number of pages needed to show every row (at least 1).
+    """
+    return max(1, -(-len(df) // page_size))
+
+
+def _to_text(value):
+    """
+    Render a nested cell (dict, list or array) as compact JSON text.
+    """
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    try:
+        return json.dumps(value, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def page_window(df, page=1, page_size=100):
+    """
+    Return one page of rows ready to be sent to the browser.
+
+    Only the rows of the page are copied; nested cells (dicts, lists) in
+    those rows are turned into JSON text, so the frontend never receives
+    the nested objects of the whole frame.
+
+    Parameters:
+        - df: DataFrame to preview.
+        - page: 1-based page number (clamped to the valid range).
+        - page_size: Number of rows per page.
+
+    Returns:
+        - A DataFrame with at most `page_size` rows, indexed by row position.
+    """
+    page = min(max(int(page), 1), page_count(df, page_size))
+    start = (page - 1) * page_size
+    window = df.iloc[start:start + page_size].copy()
+    window.index = pd.RangeIndex(start, start + len(window))
+    for column in window.columns:
+        if window[column].dtype != object:
+            continue
+        nested = window[column].map(lambda value: isinstance(value, (dict, list, np.ndarray)))
+        if nested.any():
+            window[column] = window[column].map(
+                lambda value: _to_text(value) if isinstance(value, (dict, list, np.ndarray)) else value)
+    return window
+
+
+# --- Summary Statistics ---
+def summarize(df):
+    """
+    Compute per-column summary statistics of a table.
+
+    Meant to be computed once per loaded file (and cached), not per rerun.
+
+    Returns:
+        - A DataFrame with one row per column: dtype, non-null count, number of
+          distinct values (None for nested columns), and min/mean/max of numeric columns.
+    """
+    rows = []
+    for column in df.columns:
+        series = df[column]
+        numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        try:
+            distinct = int(series.nunique(dropna=True))
+        except TypeError:  # Unhashable nested values
+            distinct = None
+        rows.append({
+            'column': column,
+            'dtype': str(series.dtype),
+            'non_null': int(series.notna().sum()),
+            'distinct': distinct,
+            'min': series.min() if numeric else None,
+            'mean': series.mean() if numeric else None,
+            'max': series.max() if numeric else None,
+        })
+    summary = pd.DataFrame(rows, columns=['column', 'dtype', 'non_null', 'distinct', 'min', 'mean', 'max'])
+    return summary.astype({'distinct': 'Int64'})
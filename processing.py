@@ -1,32 +1,495 @@
+import numpy as np
 import pandas as pd
+import streamlit as st
 import json
-from operator import itemgetter
+import codecs
+import io
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from instrument import stage, staged
 
 price_file = r"product_price_tag.csv"
 
+# --- Streaming JSON Reader ---
+def _file_size(file):
+    """
+    Return the size of an uploaded or opened file in bytes, or None if unknown.
+    """
+    size = getattr(file, 'size', None)
+    if size is not None:
+        return size
+    try:
+        position = file.tell()
+        file.seek(0, io.SEEK_END)
+        size = file.tell()
+        file.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def iter_json_records(file, read_size=1 << 20, progress=None):
+    """
+    Yield the items of a top-level JSON array one record at a time.
+
+    Only a bounded window of the raw text is kept in memory, so the whole
+    upload never has to be decoded into one Python list.
+
+    Parameters:
+        - file: Binary or text file object positioned at the start of the JSON.
+        - read_size: Number of bytes/characters read from the file per step.
+        - progress: Optional callable receiving the fraction (0-1) of the file consumed.
+
+    Raises:
+        - ValueError: If the top-level JSON value is not an array.
+        - json.JSONDecodeError: If the content is not valid JSON.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    total = _file_size(file)
+    consumed = 0
+
+    def read_more():
+        nonlocal consumed
+        chunk = file.read(read_size)
+        consumed += len(chunk)
+        if progress is not None and total:
+            progress(min(consumed / total, 1.0))
+        if isinstance(chunk, bytes):
+            return text_decoder.decode(chunk, final=not chunk), not chunk
+        return chunk, not chunk
+
+    buf, eof = read_more()
+    pos = 0
+
+    def skip_whitespace():
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            buf, eof = read_more()
+            pos = 0
+
+    skip_whitespace()
+    if pos >= len(buf) or buf[pos] != '[':
+        raise ValueError("Top-level JSON value is not an array.")
+    pos += 1
+
+    expect_value = True
+    seen_value = False
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise json.JSONDecodeError("Unterminated JSON array", buf, pos)
+        char = buf[pos]
+        if char == ']':
+            if expect_value and seen_value:
+                raise json.JSONDecodeError("Expecting value", buf, pos)
+            break
+        if not expect_value:
+            if char != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            expect_value = True
+            continue
+
+        # Decode one record, reading more text while it is still incomplete.
+        # A value ending exactly at the end of the window may be a truncated
+        # number or literal, so it is retried once more text is available.
+        while True:
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more, eof = read_more()
+            buf = buf[pos:] + more
+            pos = 0
+
+        pos = end
+        expect_value = False
+        seen_value = True
+        yield record
+
+        # Drop the already consumed part of the window
+        if pos > read_size:
+            buf = buf[pos:]
+            pos = 0
+
+    # Like json.load, reject anything but whitespace after the array
+    pos += 1
+    skip_whitespace()
+    if pos < len(buf):
+        raise json.JSONDecodeError("Extra data", buf, pos)
+
+    if progress is not None:
+        progress(1.0)
+
+
+def _peek_json_type(file):
+    """
+    Return the first non-whitespace character of a JSON file and rewind it.
+    """
+    head = file.read(64)
+    file.seek(0)
+    if isinstance(head, bytes):
+        head = head.decode('utf-8-sig', errors='ignore')
+    head = head.lstrip()
+    return head[:1]
+
+
+def _concat_frames(parts):
+    """
+    Concatenate DataFrames built from consecutive record batches.
+
+    Columns whose dtype differs between batches, or that are missing from some
+    batches (e.g. a field that is empty or absent in every record of a batch),
+    are re-inferred from their values, so they get the dtype `pd.DataFrame`
+    would give the whole list of records.
+    """
+    with warnings.catch_warnings():
+        # Missing columns in a batch are filled with NaN exactly as the
+        # whole-list constructor does; silence pandas' dtype-inference notice.
+        warnings.simplefilter('ignore', FutureWarning)
+        merged = pd.concat(parts, ignore_index=True, sort=False)
+    for column in merged.columns:
+        dtypes = {str(part[column].dtype) if column in part.columns else None for part in parts}
+        if len(dtypes) > 1:
+            merged[column] = pd.Series(merged[column].astype(object).tolist(), index=merged.index)
+    return merged
+
+
+def records_to_dataframe(records, batch_size=5000):
+    """
+    Build a DataFrame from an iterable of records in bounded-size column chunks.
+
+    Produces the same frame as `pd.DataFrame(list(records))` while only holding
+    `batch_size` raw records at a time.
+    """
+    chunks = []
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            chunks.append(pd.DataFrame(batch))
+            batch = []
+    if batch or not chunks:
+        chunks.append(pd.DataFrame(batch))
+    if len(chunks) == 1:
+        return chunks[0]
+    return _concat_frames(chunks)
+
+
+def records_to_tables(records, batch_size=5000):
+    """
+    Normalize an iterable of records batch by batch into relational tables.
+    """
+    parts = []
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            parts.append(normalize_survey(pd.DataFrame(batch)))
+            batch = []
+    if batch or not parts:
+        parts.append(normalize_survey(pd.DataFrame(batch)))
+    return parts[0] if len(parts) == 1 else _concat_tables(parts)
+
+
+# --- Normalized Survey Tables ---
+# Nested history columns split into child tables by `normalize_survey`
+HISTORY_KEYS = ['purchase', 'education', 'job', 'residence', 'interior', 'children', 'pet', 'vehicle']
+
+EDUCATION_LEVELS = {'high': '고등졸업', 'college': '학사졸업', 'master': '석사졸업', 'phd': '박사졸업'}
+
+
+def _history_table(df, key):
+    """
+    Explode the nested `df[key]['history']` lists into one long table.
+
+    Parameters:
+        - df: DataFrame of respondents with nested history columns.
+        - key: History column name (e.g. 'purchase', 'education').
+
+    Returns:
+        - A DataFrame with one row per history entry: `_row` (position of the
+          respondent in `df`), `_seq` (position in the original history list)
+          followed by the entry's own fields.
+    """
+    rows, seqs, entries = [], [], []
+    if key in df.columns:
+        for row, value in enumerate(df[key].tolist()):
+            history = value.get('history') if isinstance(value, dict) else None
+            for seq, hist in enumerate(history or []):
+                rows.append(row)
+                seqs.append(seq)
+                entries.append(hist)
+
+    table = pd.DataFrame(entries)
+    table.insert(0, '_row', np.array(rows, dtype='int64'))
+    table.insert(1, '_seq', np.array(seqs, dtype='int64'))
+    return table
+
+
+def _column(table, name):
+    """
+    Return `table[name]`, or an all-missing column if the field never occurs.
+    """
+    if name in table.columns:
+        return table[name]
+    return pd.Series(None, index=table.index, dtype=object)
+
+
+def _flatten_person(df):
+    """
+    Build the person table: scalar respondent columns, with dictionary columns
+    (e.g. `income`) flattened into dotted columns such as `income.hh_income_range`.
+    """
+    person = df.drop(columns=[key for key in HISTORY_KEYS if key in df.columns]).reset_index(drop=True)
+    for column in list(person.columns):
+        if person[column].dtype != object:
+            continue
+        values = person[column].tolist()
+        if not any(isinstance(v, dict) for v in values):
+            continue
+        flat = pd.json_normalize([v if isinstance(v, dict) else {} for v in values]).add_prefix(f"{column}.")
+        position = person.columns.get_loc(column)
+        person = pd.concat([person.iloc[:, :position], flat, person.iloc[:, position + 1:]], axis=1)
+    return person
+
+
+def normalize_survey(df):
+    """
+    Split a respondent DataFrame into relational tables keyed by `id`.
+
+    Parameters:
+        - df: DataFrame with one nested record per respondent.
+
+    Returns:
+        - A dictionary with a 'person' table (one row per respondent) and one long
+          table per history in `HISTORY_KEYS`. Child tables carry `_row` (position
+          in the person table), `id` and `_seq` (position in the original history list).
+    """
+    person = _flatten_person(df)
+    tables = {'person': person}
+    ids = person['id'].to_numpy() if 'id' in person.columns else np.arange(len(person))
+    for key in HISTORY_KEYS:
+        table = _history_table(df, key)
+        table.insert(1, 'id', ids[table['_row'].to_numpy()])
+        tables[key] = table
+    return tables
+
+
+def _concat_tables(parts):
+    """
+    Concatenate normalized tables built from consecutive record batches.
+
+    Gives the same tables as `normalize_survey` on all records at once: batches
+    without entries for a history are left out of that child table (so its
+    integer columns stay integers), and other columns are re-inferred as in
+    `_concat_frames`.
+    """
+    offsets = np.cumsum([0] + [len(part['person']) for part in parts[:-1]])
+    tables = {'person': _concat_frames([part['person'] for part in parts])}
+    for key in HISTORY_KEYS:
+        shifted = [part[key].assign(_row=part[key]['_row'] + offset)
+                   for part, offset in zip(parts, offsets) if len(part[key])]
+        tables[key] = _concat_frames(shifted) if shifted else parts[0][key]
+    return tables
+
+
+def _as_tables(data):
+    """
+    Return normalized tables for either a raw respondent DataFrame or tables
+    already produced by `normalize_survey`.
+    """
+    if isinstance(data, dict):
+        return data
+    return normalize_survey(data)
+
+
+def _select_people(tables, mask):
+    """
+    Restrict normalized tables to the respondents selected by a boolean mask.
+
+    Parameters:
+        - tables: Normalized tables from `normalize_survey`.
+        - mask: Boolean array aligned with the person table.
+
+    Returns:
+        - New tables whose `_row` refers to positions in the filtered person table.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    positions = np.full(len(mask), -1, dtype='int64')
+    positions[mask] = np.arange(int(mask.sum()))
+    selected = {'person': tables['person'][mask].reset_index(drop=True)}
+    for key in HISTORY_KEYS:
+        table = tables[key]
+        rows = positions[table['_row'].to_numpy()]
+        keep = rows >= 0
+        table = table[keep].reset_index(drop=True)
+        table['_row'] = rows[keep]
+        selected[key] = table
+    return selected
+
+
+# --- Record Filters Applied While Loading ---
+# Region of respondents without one, as Options 1 and 2 have always treated them
+DEFAULT_REGION = 'KOR'
+
+
+def _year_at_least(hist, min_year):
+    """
+    Return True if a history entry has a `year` of at least `min_year`.
+    """
+    year = hist.get('year') if isinstance(hist, dict) else None
+    try:
+        return year is not None and year >= min_year
+    except TypeError:
+        return False
+
+
+def filter_records(records, locations=None, min_year=None):
+    """
+    Apply region and purchase-year predicates to respondent records as they are parsed.
+
+    Excluded respondents are dropped before they reach a DataFrame, and purchase
+    history entries before `min_year` are removed from the kept records.
+
+    Parameters:
+        - records: Iterable of respondent dictionaries.
+        - locations: Regions to keep (e.g. ['KOR']); None keeps every respondent.
+          Records without a region (or with None) count as `DEFAULT_REGION`.
+        - min_year: Drop purchase history entries before this year; None keeps all.
+          Only Option 2 filters purchases by year, so leave it unset for Options 1 and 3.
+
+    Yields:
+        - The records that pass the filters.
+    """
+    locations = set(locations) if locations is not None else None
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        if locations is not None:
+            region = record.get('region')
+            if (DEFAULT_REGION if region is None else region) not in locations:
+                continue
+        if min_year is not None:
+            purchase = record.get('purchase')
+            if isinstance(purchase, dict) and isinstance(purchase.get('history'), list):
+                history = [hist for hist in purchase['history'] if _year_at_least(hist, min_year)]
+                record['purchase'] = {**purchase, 'history': history}
+        yield record
+
+
+def select_regions(tables, locations=None):
+    """
+    Keep the respondents of normalized tables whose region is one of `locations`.
+
+    Applies the region predicate of `filter_records` to tables loaded without
+    it, so one snapshot of an upload serves every region prefilter.
+
+    Returns:
+        - The filtered tables (the same tables when every respondent is kept).
+    """
+    if locations is None:
+        return tables
+    person = tables['person']
+    if 'region' in person.columns:
+        regions = person['region'].astype(object).where(person['region'].notna(), DEFAULT_REGION)
+    else:
+        regions = pd.Series(DEFAULT_REGION, index=person.index, dtype=object)
+    mask = regions.isin(list(locations)).to_numpy()
+    if mask.all():
+        return tables
+    return _select_people(tables, mask)
+
+
 # --- Function to Load JSON Files into DataFrames ---
-def load_json_files(uploaded_files):
+def _row_count(data):
+    """
+    Return the number of respondents of a loaded DataFrame or normalized tables.
+    """
+    if data is None:
+        return None
+    return len(data['person']) if isinstance(data, dict) else len(data)
+
+
+def load_json_files(uploaded_files, streaming=False, batch_size=5000, progress=None, normalize=False,
+                    locations=None, min_year=None):
+    """
+    Load uploaded JSON files into DataFrames.
+
+    Parameters:
+        - uploaded_files: List of uploaded (or opened) JSON files.
+        - streaming: Parse top-level arrays one record at a time instead of `json.load`.
+        - batch_size: Number of records per DataFrame chunk in streaming mode.
+        - progress: Optional callable `progress(filename, fraction)` used in streaming mode.
+        - normalize: Return the relational tables of `normalize_survey` instead of
+          the nested DataFrame. In streaming mode each batch is normalized as it
+          is parsed, so the nested frame is never built in full.
+        - locations, min_year: Predicates applied to each record as it is parsed,
+          see `filter_records`. Excluded respondents and purchases never become
+          DataFrame cells.
+
+    Returns:
+        - A dictionary mapping each filename to its DataFrame (or normalized tables).
+    """
     dataframes = {}
     for file in uploaded_files:
-        try:
-            # Read the raw JSON content
-            raw_json = json.load(file)
-
-            # Process based on JSON structure
-            if isinstance(raw_json, list):
-                df = pd.DataFrame(raw_json)  # List -> DataFrame
-            elif isinstance(raw_json, dict):
-                # Dictionary -> Flattened DataFrame
-                df = pd.json_normalize(raw_json)
-            else:
-                continue  # Skip unsupported JSON structure
+        with stage('load_json_files', file=file.name, streaming=streaming, normalize=normalize) as record:
+            try:
+                if streaming and _peek_json_type(file) == '[':
+                    on_progress = None
+                    if progress is not None:
+                        on_progress = lambda fraction, name=file.name: progress(name, fraction)
+                    records = iter_json_records(file, progress=on_progress)
+                    if locations is not None or min_year is not None:
+                        records = filter_records(records, locations=locations, min_year=min_year)
+                    if normalize:
+                        dataframes[file.name] = records_to_tables(records, batch_size=batch_size)
+                    else:
+                        dataframes[file.name] = records_to_dataframe(records, batch_size=batch_size)
+                    continue
+
+                # Read the raw JSON content
+                with stage('json.load'):
+                    raw_json = json.load(file)
+
+                filtered = locations is not None or min_year is not None
 
-            dataframes[file.name] = df  # Store DataFrame with filename as key
+                # Process based on JSON structure
+                if isinstance(raw_json, list):
+                    if filtered:
+                        raw_json = list(filter_records(raw_json, locations=locations, min_year=min_year))
+                    df = pd.DataFrame(raw_json)  # List -> DataFrame
+                elif isinstance(raw_json, dict):
+                    if filtered:
+                        raw_json = list(filter_records([raw_json], locations=locations, min_year=min_year))
+                        raw_json = raw_json[0] if raw_json else []
+                    # Dictionary -> Flattened DataFrame
+                    df = pd.json_normalize(raw_json)
+                else:
+                    continue  # Skip unsupported JSON structure
 
-        except json.JSONDecodeError:
-            continue  # Skip invalid JSON
-        except Exception:
-            continue  # Skip on other errors
+                if normalize:
+                    with stage('normalize_survey', rows_in=len(df)):
+                        df = normalize_survey(df)
+                dataframes[file.name] = df  # Store DataFrame with filename as key
+
+            except json.JSONDecodeError:
+                continue  # Skip invalid JSON
+            except Exception:
+                continue  # Skip on other errors
+            finally:
+                record['rows_out'] = _row_count(dataframes.get(file.name))
     return dataframes
 
 # --- Function to Load Price DataFrame ---
@@ -47,7 +510,8 @@ def load_price_data(file_path=price_file):
     try:
         # Load the CSV with UTF-8-SIG encoding to handle special characters
         price_df = pd.read_csv(file_path, encoding='utf-8-sig')
-        price_df['kind'] = price_df['kind'].astype('str')
+        # 'None' kinds (per-product fallback prices) are read as NaN by pandas
+        price_df['kind'] = price_df['kind'].fillna('None').astype('str')
         price_df['name'] = price_df['product_id']
         price_df['kind_name'] = price_df['kind']
         
@@ -57,90 +521,331 @@ def load_price_data(file_path=price_file):
     except Exception as e:
         raise RuntimeError(f"Error loading price data: {e}")
 
+# --- Price Catalog ---
+class PriceCatalog:
+    """
+    Price table indexed by interned (product_id, kind) codes.
+
+    The CSV is loaded once and reloaded only when its modification time
+    changes. Purchases without a kind are priced with the product's 'None' row.
+    """
+
+    def __init__(self, file_path=price_file):
+        self.file_path = file_path
+        self._mtime = None
+        self._lock = threading.Lock()
+        # (products, kinds, index, prices, frame), replaced as a whole on reload so
+        # lookups running in other threads never mix an old and a new price file
+        self._state = None
+
+    @property
+    def products(self):
+        return self._state[0]
+
+    @property
+    def kinds(self):
+        return self._state[1]
+
+    @property
+    def frame(self):
+        return self._state[4] if self._state is not None else None
+
+    def refresh(self):
+        """
+        Reload the price file if it changed since the last load.
+
+        Returns:
+            - The catalog itself.
+        """
+        try:
+            mtime = os.path.getmtime(self.file_path)
+        except OSError:
+            raise FileNotFoundError(f"Price CSV file '{self.file_path}' not found in the directory.")
+        with self._lock:
+            if mtime != self._mtime:
+                self._build(load_price_data(self.file_path))
+                self._mtime = mtime
+        return self
+
+    def _build(self, price_df):
+        required_cols = ['product_id', 'kind', 'price']
+        if not all(col in price_df.columns for col in required_cols):
+            raise KeyError("The price file is missing required columns: 'product_id', 'kind', 'price'.")
+
+        # Later rows win for duplicated keys, like building a dict
+        price_df = price_df.drop_duplicates(['product_id', 'kind'], keep='last').reset_index(drop=True)
+        products = pd.Categorical(price_df['product_id'].astype(object))
+        kinds = pd.Categorical(price_df['kind'].astype(object))
+        keys = products.codes.astype('int64') * len(kinds.categories) + kinds.codes
+        self._state = (products.categories, kinds.categories, pd.Index(keys), price_df['price'].to_numpy(), price_df)
+
+    def codes(self, names, kinds, state=None):
+        """
+        Return the catalog row of every (product_id, kind) pair, or -1 if unpriced.
+
+        Parameters:
+            - names: Sequence of product ids.
+            - kinds: Sequence of kinds; missing kinds map to 'None'.
+            - state: Catalog state to use (default: the current one).
+        """
+        products, kind_labels, index, _, _ = state or self._state
+        kinds = pd.Series(kinds, dtype=object)
+        kinds = kinds.where(kinds.notna(), None).map(str)
+        # Unknown products and kinds get -1
+        product_codes = products.get_indexer(pd.Series(names, dtype=object)).astype('int64')
+        kind_codes = kind_labels.get_indexer(kinds).astype('int64')
+        rows = index.get_indexer(product_codes * len(kind_labels) + kind_codes)
+        rows[(product_codes < 0) | (kind_codes < 0)] = -1
+        return rows
+
+    def lookup(self, names, kinds):
+        """
+        Return the price of every (product_id, kind) pair.
+
+        Returns:
+            - A numpy array in the catalog's price dtype, or float64 with NaN
+              for unpriced pairs if there are any.
+        """
+        # Read the state once: rows and prices must come from the same load
+        state = self._state
+        rows = self.codes(names, kinds, state)
+        found = rows >= 0
+        if found.all():
+            return state[3][rows]
+        prices = np.full(len(rows), np.nan)
+        prices[found] = state[3][rows[found]]
+        return prices
+
+
+_price_catalogs = {}
+_price_catalogs_lock = threading.Lock()
+
+
+def get_price_catalog(file_path=price_file):
+    """
+    Return the shared, up-to-date price catalog of a price file.
+    """
+    key = os.path.abspath(file_path)
+    with _price_catalogs_lock:
+        catalog = _price_catalogs.setdefault(key, PriceCatalog(file_path))
+    return catalog.refresh()
+
+
 # --- Placeholder Processing Functions ---
 
 
+DEMOGRAPHIC_COLUMNS = [
+    'id', 'source', 'sex', 'marriage', 'age', 'ages', 'current_job', 'self_income', 'hh_income', 'last_ed', 'region'
+]
+
+
+def _or_none(person, name):
+    """
+    Return `person[name]` with missing or empty values set to None, like
+    `dict.get(...) or None` (an all-None column if the field never occurs).
+    """
+    if name not in person.columns:
+        return pd.Series(None, index=person.index, dtype=object)
+    values = person[name].astype(object)
+    return values.where(values.notna() & values.astype(bool), None).infer_objects()
+
+
+@staged('option1')
 def process_selected_files_1(dataframes, filenames, locations=['KOR']):
     """
     Process demographic data from JSON files.
 
     Parameters:
-        - dataframes: List of DataFrames created from JSON files.
+        - dataframes: List of DataFrames created from JSON files, or their
+          normalized tables from `normalize_survey`.
         - filenames: List of filenames corresponding to the dataframes.
 
     Returns:
-        - A DataFrame containing the demographic data.
+        - A DataFrame containing the demographic data, with categorical
+          `source`, `sex`, `marriage`, `last_ed` and `region` columns.
     """
-    # Initialize a list to hold the results
-    check = []
+    # Initialize a list to hold the per-file results
+    parts = []
 
     # Process each DataFrame and corresponding filename
     for data, filename in zip(dataframes, filenames):
         # Extract source name from the filename (characters before the first `_`)
         name = filename.split('_')[0] + "_" + filename.split('_')[1]
 
-        # Flatten the demographic data
-        filtered_hist = [
-            {
-                'id': d['id'],
-                'sex': '남' if d['gender'] == 1 else '여',
-                'marriage': '기혼' if d['marriage'] > 0 else '미혼',
-                'age': d['age'],
-                'ages': d['ages'],
-                'current_job': d['occupation_name'],
-                'self_income': d['income'].get('self_income_range') or None,
-                'hh_income': d['income'].get('hh_income_range') or None,
-                'brand_name': d.get('brand_name', None),
-                'last_ed': {
-                    'high': '고등졸업',
-                    'college': '학사졸업',
-                    'master': '석사졸업',
-                    'phd': '박사졸업'
-                }.get(d['education']['history'][0]['level'], None),  # Map education level
-                'region': d.get('region', 'KOR')  # Assuming region is part of d
-            }
-            # Convert DataFrame to list of records
-            for d in data.to_dict(orient='records')
-        ]
-
-        # Create a DataFrame from the filtered demographic data
-        hist_df = pd.DataFrame(filtered_hist)
-
-        # Prepare the final output
-        for _, row in hist_df.iterrows():
-            # Check if the region is 'KOR' or None and include in the results
-            if row['region'] in locations:
-                check.append([
-                    row['id'],
-                    name,
-                    row['sex'],
-                    row['marriage'],
-                    row['age'],
-                    row['ages'],
-                    row['current_job'],
-                    row['self_income'],
-                    row['hh_income'],
-                    row['last_ed'],
-                    row['region']
-                ])
-
-    # Sort the results
-    check = sorted(check, key=itemgetter(0, 10))
-
-    # Create the final DataFrame
-    demo = pd.DataFrame(check, columns=[
-        'id', 'source', 'sex', 'marriage', 'age', 'ages', 'current_job', 'self_income', 'hh_income', 'last_ed', 'region'
-    ])
+        with stage('option1.columns', file=filename) as record:
+            tables = _as_tables(data)
+            person = tables['person']
 
+            # Keep the respondents whose region is one of the locations
+            region = person['region'] if 'region' in person.columns else pd.Series('KOR', index=person.index)
+            mask = region.isin(locations).to_numpy()
+
+            # The last education level is the first entry of the education history
+            education = tables['education']
+            first_education = education[education['_seq'] == 0]
+            level = pd.Series(_column(first_education, 'level').to_numpy(dtype=object),
+                              index=first_education['_row'].to_numpy())
+            last_ed = level.reindex(np.arange(len(person))).map(EDUCATION_LEVELS)
+
+            # Map the demographic codes column by column
+            parts.append(pd.DataFrame({
+                'id': person['id'],
+                'source': name,
+                'sex': np.where(person['gender'] == 1, '남', '여'),
+                'marriage': np.where(person['marriage'] > 0, '기혼', '미혼'),
+                'age': person['age'],
+                'ages': person['ages'],
+                'current_job': person['occupation_name'],
+                'self_income': _or_none(person, 'income.self_income_range'),
+                'hh_income': _or_none(person, 'income.hh_income_range'),
+                'last_ed': last_ed.to_numpy(dtype=object),
+                'region': region,
+            })[mask])
+            record['rows_in'], record['rows_out'] = len(person), len(parts[-1])
+
+    if not parts:
+        return _typed_demographics(pd.DataFrame(columns=DEMOGRAPHIC_COLUMNS))
+
+    # Sort the results (stable, like sorting the rows on (id, region))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        demo = pd.concat(parts, ignore_index=True)
+    with stage('option1.sort', rows_in=len(demo)):
+        demo = demo.sort_values(['id', 'region'], kind='stable').reset_index(drop=True)
+        return _typed_demographics(demo.infer_objects())
+
+
+def _typed_demographics(demo):
+    """
+    Apply the categorical dtypes of the Option 1 output.
+    """
+    demo['source'] = demo['source'].astype('category')
+    demo['sex'] = pd.Categorical(demo['sex'], categories=['남', '여'])
+    demo['marriage'] = pd.Categorical(demo['marriage'], categories=['기혼', '미혼'])
+    demo['last_ed'] = pd.Categorical(demo['last_ed'], categories=list(EDUCATION_LEVELS.values()))
+    demo['region'] = demo['region'].astype('category')
     return demo
 
 
+# --- Compact History Arrays ---
+def history_offsets(table, size):
+    """
+    Return the CSR offsets of a long history table sorted by `_row`.
+
+    The entries of respondent `r` are rows `offsets[r]:offsets[r + 1]`, so
+    per-respondent positions and counts come from integer arithmetic
+    instead of a groupby.
+
+    Parameters:
+        - table: Long history table (sorted by `_row`, as `normalize_survey` builds it).
+        - size: Number of respondents in the person table.
+
+    Returns:
+        - An int64 array of length `size + 1`.
+    """
+    return np.searchsorted(table['_row'].to_numpy(), np.arange(size + 1)).astype('int64')
+
+
+def _row_year_keys(row_arrays, year_arrays):
+    """
+    Encode (respondent row, year) pairs of several tables as int64 keys.
+
+    Years are replaced by their rank among all distinct years, so any numeric
+    year (including non-integer floats) maps to an exact integer.
+
+    Returns:
+        - One int64 key array per input table; pairs with a missing year get -1.
+    """
+    years = [np.asarray(year, dtype='float64') for year in year_arrays]
+    valid = np.concatenate(years) if years else np.empty(0)
+    distinct = np.unique(valid[~np.isnan(valid)])
+    keys = []
+    for rows, year in zip(row_arrays, years):
+        code = np.searchsorted(distinct, year)
+        key = np.asarray(rows, dtype='int64') * (len(distinct) + 1) + code
+        keys.append(np.where(np.isnan(year), -1, key))
+    return keys
+
+
+# --- Purchase Event Tagging ---
+# Life events used to tag purchases in Option 2, in override order: when a
+# purchase year matches several histories the later entry wins
+# (car > pet > child > int > res > edu).
+EVENT_SOURCES = [
+    ('edu', 'education'),
+    ('res', 'residence'),
+    ('int', 'interior'),
+    ('child', 'children'),
+    ('pet', 'pet'),
+    ('car', 'vehicle'),
+]
+
+
+def _to_str(series):
+    """
+    Convert a column to strings the way `str()` does on the raw JSON values.
+
+    Missing values become 'None' regardless of how pandas stores them.
+    """
+    values = series.astype(object)
+    return values.where(values.notna(), None).map(str)
+
+
+def _resolve_events(purchases, histories, skip=()):
+    """
+    Tag each purchase with the life event recorded for the same respondent and year.
+
+    Parameters:
+        - purchases: Long purchase table with `_row` and `year` columns.
+        - histories: Dictionary of long history tables keyed by history name.
+        - skip: Event names to ignore (e.g. 'pet' for nielsen sources).
+
+    Returns:
+        - An object Series of event names aligned with `purchases` ('no' if none).
+    """
+    names = np.array([event for event, _ in EVENT_SOURCES], dtype=object)
+    sources = [
+        (rank, histories[key])
+        for rank, (event, key) in enumerate(EVENT_SOURCES)
+        if event not in skip and 'year' in histories[key].columns
+    ]
+    event = pd.Series('no', index=purchases.index, dtype=object)
+    if not sources or purchases.empty:
+        return event
+
+    # Integer (respondent, year) keys for the purchases and every event entry
+    keys = _row_year_keys(
+        [purchases['_row'].to_numpy()] + [table['_row'].to_numpy() for _, table in sources],
+        [purchases['year'].to_numpy(dtype='float64')] + [table['year'].to_numpy(dtype='float64') for _, table in sources])
+    purchase_keys, event_keys = keys[0], keys[1:]
+    mark_keys = np.concatenate(event_keys)
+    mark_ranks = np.concatenate([np.full(len(k), rank, dtype='int64') for (rank, _), k in zip(sources, event_keys)])
+    present = mark_keys >= 0
+    mark_keys, mark_ranks = mark_keys[present], mark_ranks[present]
+    if not len(mark_keys):
+        return event
+
+    # Highest-priority event per key: sort by (key, rank) and keep the last of each key
+    order = np.lexsort((mark_ranks, mark_keys))
+    mark_keys, mark_ranks = mark_keys[order], mark_ranks[order]
+    last = np.append(mark_keys[1:] != mark_keys[:-1], True)
+    mark_keys, mark_ranks = mark_keys[last], mark_ranks[last]
+
+    # Look every purchase key up with a binary search
+    position = np.minimum(np.searchsorted(mark_keys, purchase_keys), len(mark_keys) - 1)
+    matched = (purchase_keys >= 0) & (mark_keys[position] == purchase_keys)
+    event.iloc[np.flatnonzero(matched)] = names[mark_ranks[position[matched]]]
+    return event
+
+
+@staged('option2')
 def process_selected_files_2(dataframes, filenames, year=2010, locations=['KOR'], price_file=price_file):
     """
     Process selected JSON files to filter purchase history data and merge with price information.
 
     Parameters:
-        - dataframes: List of DataFrames created from JSON files.
+        - dataframes: List of DataFrames created from JSON files, or their
+          normalized tables from `normalize_survey`.
         - filenames: List of filenames corresponding to the dataframes.
         - year: The year to filter purchase history (default: 2010).
         - price_file: The path to the CSV file containing price information.
@@ -148,248 +853,727 @@ def process_selected_files_2(dataframes, filenames, year=2010, locations=['KOR']
     Returns:
         - A DataFrame containing the final merged and processed results.
     """
-    # Load price data
-    price_df = load_price_data(price_file)
+    # Load price data (reloaded only when the file changes)
+    catalog = get_price_catalog(price_file)
 
-    # Check if price_df has required columns
-    if not all(col in price_df.columns for col in ['name', 'kind_name']):
-        raise KeyError(
-            "The price file is missing required columns: 'name', 'kind_name'.")
+    columns = ['country', 'source', 'id', 'cid', 'product', 'ages', 'age', 'year', 'detail', 'brand', 'price', 'event']
 
-    # Initialize an empty list to store the results
-    check = []
+    # Collect one result frame per file
+    results = []
 
     # Iterate over the provided DataFrames and filenames
-    for df, filename in zip(dataframes, filenames):
+    for file_index, (df, filename) in enumerate(zip(dataframes, filenames)):
         # Extract source name from the filename (characters after the first `_`)
         source_name = filename.split('_')[0] + "_" + filename.split('_')[1] if '_' in filename else filename
-        filtered_df = df[df['region'].isin(locations)]
-
-        # Flatten the purchase history and filter by the given year
-        filtered_hist = []
-        for d in filtered_df.to_dict(orient='records'):
-            # Sort various histories by year or relevant keys
-            sorted_purchase_history = sorted(
-                d.get('purchase', {}).get('history', []), key=itemgetter('year'))
-            sorted_education_history = sorted(
-                d.get('education', {}).get('history', []), key=itemgetter('age'))
-            sorted_res_history = sorted(d.get('residence', {}).get(
-                'history', []), key=itemgetter('age_of_move_in'))
-            sorted_int_history = sorted(d.get('interior', {}).get(
-                'history', []), key=itemgetter('year'))
-            sorted_child_history = sorted(d.get('children', {}).get(
-                'history', []), key=itemgetter('year'))
-            sorted_pet_history = sorted(d.get('pet', {}).get(
-                'history', []), key=itemgetter('year')) if source_name != 'nielsen' else None
-            sorted_car_history = sorted(d.get('vehicle', {}).get(
-                'history', []), key=itemgetter('year'))
-
-            # Process purchase history
-            for hist in sorted_purchase_history:
-                if hist['year'] >= year:
-                    # Determine event type based on other histories
-                    event = 'no'
-                    for edhist in sorted_education_history:
-                        if hist['year'] == edhist['year']:
-                            event = 'edu'
-                            break
-                    for reshist in sorted_res_history:
-                        if hist['year'] == reshist['year']:
-                            event = 'res'
-                            break
-                    for inthist in sorted_int_history:
-                        if hist['year'] == inthist['year']:
-                            event = 'int'
-                            break
-                    for chhist in sorted_child_history:
-                        if hist['year'] == chhist['year']:
-                            event = 'child'
-                            break
-                    if sorted_pet_history:
-                        for pethist in sorted_pet_history:
-                            if hist['year'] == pethist['year']:
-                                event = 'pet'
-                                break
-                    for carhist in sorted_car_history:
-                        if hist['year'] == carhist['year']:
-                            event = 'car'
-                            break
-
-                    filtered_hist.append({
-                        'id': d['id'],
-                        'age': d['age'],
-                        'ages': d['ages'],
-                        'year': hist['year'],
-                        'name': hist['name'],
-                        'kind_name': str(hist['kind_name']),
-                        'brand_name': hist['brand_name'],
-                        'birth': d['birth'],
-                        'region': d.get('region', None),
-                        'event': event
-                    })
-
-        # Create a DataFrame from the filtered history
-        hist_df = pd.DataFrame(filtered_hist)
-
-        # Skip if hist_df is empty
-        if hist_df.empty:
+        with stage('option2.select', file=filename) as record:
+            tables = _as_tables(df)
+            histories = _select_people(tables, tables['person']['region'].isin(locations))
+            filtered_df = histories['person']
+
+            # Long purchase table of the selected respondents
+            purchases = histories['purchase']
+            if 'year' in purchases.columns:
+                # Sort purchases by year within each respondent and filter by the given year
+                purchases = purchases.sort_values(['_row', 'year'], kind='stable')
+                purchases = purchases[purchases['year'] >= year].reset_index(drop=True)
+            else:
+                purchases = purchases.iloc[0:0]
+            record['rows_in'], record['rows_out'] = len(tables['purchase']), len(purchases)
+
+        # Skip if the filtered history is empty
+        if purchases.empty:
             st.warning(
                 f"Filtered purchase history is empty for source: {source_name}")
             continue
 
-        # Merge the filtered history with the price information
-        try:
-            merged_df = hist_df.merge(
-                price_df, on=['name', 'kind_name'], how='left')
-        except KeyError as e:
-            raise KeyError(
-                f"Merge error: {e}. Check if 'name' and 'kind_name' columns exist in both DataFrames.")
-
-        # Process the merged data
-        for _, row in merged_df.iterrows():
-            if row['region'] == 'KOR' or row['region'] is None:
-                check.append([
-                    'KOR',
-                    source_name,
-                    row['id'],
-                    f"{source_name}_{row['id']}",  # CID
-                    row['name'],
-                    row['ages'],
-                    # Calculate age at the purchase year
-                    row['year'] - row['birth'],
-                    row['year'],
-                    row['kind_name'],
-                    row['brand_name'],
-                    row['price'],
-                    row['event']
-                ])
-            elif row['region'] == 'US': 
-                check.append([
-                    'US',
-                    source_name,
-                    row['id'],
-                    f"{source_name}_{row['id']}",  # CID
-                    row['name'],
-                    row['ages'],
-                    # Calculate age at the purchase year
-                    row['year'] - row['birth'],
-                    row['year'],
-                    row['kind_name'],
-                    row['brand_name'],
-                    row['price'],
-                    row['event']
-                ])
-
-    # Sort the results
-    check = sorted(check, key=itemgetter(0, 2, 6))
-
-    # Create the final DataFrame
-    result_df = pd.DataFrame(check, columns=[
-        'country', 'source', 'id', 'cid', 'product', 'ages', 'age', 'year', 'detail', 'brand', 'price', 'event'
-    ])
+        # Determine event type based on other histories
+        with stage('option2.events', rows_in=len(purchases), file=filename):
+            purchases['event'] = _resolve_events(
+                purchases, histories, skip=('pet',) if source_name == 'nielsen' else ())
+
+        # Attach the respondent attributes to every purchase
+        people = filtered_df.iloc[purchases['_row'].to_numpy()].reset_index(drop=True)
+        hist_df = pd.DataFrame({
+            '_row': purchases['_row'],
+            '_seq': purchases['_seq'],
+            'id': people['id'],
+            'ages': people['ages'],
+            'year': purchases['year'],
+            'name': purchases['name'],
+            'kind_name': _to_str(purchases['kind_name']),
+            'brand_name': purchases['brand_name'],
+            'birth': people['birth'],
+            'region': people['region'] if 'region' in people.columns else None,
+            'event': purchases['event'],
+        })
+
+        # Look up the price of every purchase in the catalog
+        with stage('option2.price', rows_in=len(hist_df), file=filename):
+            merged_df = hist_df.assign(price=catalog.lookup(hist_df['name'], hist_df['kind_name']))
+
+        # Keep KOR (or missing region) and US respondents
+        country = merged_df['region'].where(merged_df['region'].notna(), 'KOR')
+        merged_df = merged_df[country.isin(['KOR', 'US'])]
+        country = country[merged_df.index]
+
+        results.append(pd.DataFrame({
+            'country': country,
+            'source': source_name,
+            'id': merged_df['id'],
+            'cid': source_name + '_' + _to_str(merged_df['id']),  # CID
+            'product': merged_df['name'],
+            'ages': merged_df['ages'],
+            # Calculate age at the purchase year
+            'age': merged_df['year'] - merged_df['birth'],
+            'year': merged_df['year'],
+            'detail': merged_df['kind_name'],
+            'brand': merged_df['brand_name'],
+            'price': merged_df['price'],
+            'event': merged_df['event'],
+            '_file': file_index,
+            '_row': merged_df['_row'],
+            '_seq': merged_df['_seq'],
+        }))
+
+    if not results:
+        return pd.DataFrame([], columns=columns)
+
+    # Sort the results; ties keep the file, respondent and purchase order
+    with stage('option2.sort') as record:
+        result_df = pd.concat(results, ignore_index=True)
+        result_df = result_df.sort_values(['country', 'id', 'age', '_file', '_row', '_seq'], kind='stable')
+        result_df = result_df[columns].reset_index(drop=True).infer_objects()
+        record['rows_in'] = record['rows_out'] = len(result_df)
 
     return result_df
 
 
 
+# --- Long-Format Life Event Table ---
+# Headers of Option 3 in the order they are emitted per respondent; ties of
+# the final (region, id, age) sort keep this order.
+LIFE_EVENT_HEADERS = ['marriage', 'edu', 'job', 'move', 'int', 'child', 'pet', 'car', 'purch']
+
+# (column with the event year, condition prefix, column with the age or None
+# to derive it from the birth year) for every child milestone
+CHILD_EVENTS = [
+    ('year', '자녀출산', 'age_of_birth'),
+    ('year_elementary', '자녀초입', None),
+    ('year_middle', '자녀중입', None),
+    ('year_high', '자녀고입', None),
+    ('married_year', '자녀결혼', None),
+]
+
+
+def _numbered(table, sort_key=None):
+    """
+    Sort a long history table within each respondent and number its entries.
+
+    Parameters:
+        - table: Long history table from `_history_table`.
+        - sort_key: Field to sort by within each respondent (stable), or None
+          to keep the original history order (also used if the field never occurs).
+
+    Returns:
+        - The sorted table with an `_order` column (0-based position per respondent).
+    """
+    keys = ['_row', sort_key] if sort_key in table.columns else ['_row', '_seq']
+    table = table.sort_values(keys, kind='stable').reset_index(drop=True)
+    # Position within the respondent: entry index minus the respondent's CSR offset
+    rows = table['_row'].to_numpy()
+    offsets = history_offsets(table, int(rows.max()) + 1 if len(rows) else 0)
+    table['_order'] = np.arange(len(table), dtype='int64') - offsets[rows]
+    return table
+
+
+def _event_part(header, rows, seq, sequence, condition, age, year, detail=None, brand=None, price=None):
+    """
+    Build the typed long-format rows of one event header.
+    """
+    n = len(rows)
+    missing = pd.Series([None] * n, dtype=object)
+    return pd.DataFrame({
+        '_row': np.asarray(rows, dtype='int64'),
+        '_kind': LIFE_EVENT_HEADERS.index(header),
+        '_seq': np.asarray(seq, dtype='int64'),
+        'header': header,
+        'sequence': np.asarray(sequence, dtype=object),
+        'condition': np.asarray(condition, dtype=object),
+        'age': pd.array(np.asarray(age, dtype='float64'), dtype='Int64') if n else pd.array([], dtype='Int64'),
+        'year': pd.array(np.asarray(year, dtype='float64'), dtype='Int64') if n else pd.array([], dtype='Int64'),
+        'detail': missing if detail is None else np.asarray(detail, dtype=object),
+        'brand': missing if brand is None else np.asarray(brand, dtype=object),
+        'price': np.full(n, np.nan) if price is None else np.asarray(price, dtype='float64'),
+    })
+
+
+def _life_event_table(tables, catalog):
+    """
+    Turn every respondent's histories into one long-format event table.
+
+    Parameters:
+        - tables: Normalized tables of the filtered respondents.
+        - catalog: `PriceCatalog` used to price the purchases.
+
+    Returns:
+        - A DataFrame with one row per event and `_row`/`_kind`/`_seq` ordering keys.
+    """
+    people = tables['person']
+    birth = people['birth'].to_numpy(dtype='float64')
+    parts = []
+
+    # Marriage
+    married = np.flatnonzero(people['marriage'].to_numpy() > 0)
+    marriage_year = people['marriage'].to_numpy(dtype='float64')[married]
+    parts.append(_event_part(
+        'marriage', married, np.zeros(len(married)), ['marriage'] * len(married), ['결혼'] * len(married),
+        marriage_year - birth[married], marriage_year))
+
+    def numbered_labels(header, table):
+        return (header + '_' + (table['_order'] + 1).astype(str)).to_numpy(dtype=object)
+
+    # Education: the last education level comes from the first history entry
+    edu = tables['education']
+    first = edu[edu['_seq'] == 0]
+    last_ed = np.full(len(people), None, dtype=object)
+    last_ed[first['_row'].to_numpy()] = _column(first, 'level').map(EDUCATION_LEVELS).to_numpy(dtype=object)
+    edu = _numbered(edu, 'age')
+    rows = edu['_row'].to_numpy()
+    parts.append(_event_part(
+        'edu', rows, edu['_order'], numbered_labels('edu', edu), last_ed[rows],
+        people['age'].to_numpy(dtype='float64')[rows], _column(edu, 'year')))
+
+    # Job
+    job = _numbered(tables['job'], 'job_age_of')
+    parts.append(_event_part(
+        'job', job['_row'], job['_order'], numbered_labels('job', job), _column(job, 'job_name'),
+        _column(job, 'job_age_of'), _column(job, 'year'), detail=_column(job, 'job_wage')))
+
+    # Residence
+    res = _numbered(tables['residence'], 'age_of_move_in')
+    condition = _to_str(_column(res, 'ownership')) + '_' + _to_str(_column(res, 'type')) + '_' + _to_str(_column(res, 'size'))
+    parts.append(_event_part(
+        'move', res['_row'], res['_order'], numbered_labels('move', res), condition,
+        _column(res, 'age_of_move_in'), _column(res, 'year')))
+
+    # Interior
+    inter = _numbered(tables['interior'], 'year')
+    rows = inter['_row'].to_numpy()
+    year = _column(inter, 'year').to_numpy(dtype='float64')
+    parts.append(_event_part(
+        'int', rows, inter['_order'], numbered_labels('int', inter), ['인테리어'] * len(rows),
+        year - birth[rows], year, detail=_column(inter, 'cost_amt')))
+
+    # Children: one row per milestone that happened (year present and > 0)
+    child = _numbered(tables['children'])
+    rows = child['_row'].to_numpy()
+    order = _to_str(_column(child, 'order'))
+    sequence = numbered_labels('child', child)
+    for k, (year_col, label, age_col) in enumerate(CHILD_EVENTS):
+        year = pd.to_numeric(_column(child, year_col)).to_numpy(dtype='float64')
+        age = _column(child, age_col).to_numpy(dtype='float64') if age_col else year - birth[rows]
+        keep = ~np.isnan(year) & (np.nan_to_num(year) > 0)
+        parts.append(_event_part(
+            'child', rows[keep], (child['_order'].to_numpy() * len(CHILD_EVENTS) + k)[keep], sequence[keep],
+            (label + '_' + order)[keep], age[keep], year[keep]))
+
+    # Pet
+    pet = _numbered(tables['pet'], 'year')
+    rows = pet['_row'].to_numpy()
+    year = _column(pet, 'year').to_numpy(dtype='float64')
+    parts.append(_event_part(
+        'pet', rows, pet['_order'], numbered_labels('pet', pet), ['애완동물입양'] * len(rows),
+        year - birth[rows], year, detail=_column(pet, 'kind')))
+
+    # Vehicle
+    car = _numbered(tables['vehicle'], 'year')
+    rows = car['_row'].to_numpy()
+    year = _column(car, 'year').to_numpy(dtype='float64')
+    detail = _to_str(_column(car, 'purchase')) + '_' + _to_str(_column(car, 'make')) + '_' + _to_str(_column(car, 'kind'))
+    parts.append(_event_part(
+        'car', rows, car['_order'], numbered_labels('car', car), ['자동차구매'] * len(rows),
+        year - birth[rows], year, detail=detail))
+
+    # Purchases: numbered over the full history, kept only when priced
+    purch = _numbered(tables['purchase'], 'year')
+    price = catalog.lookup(_column(purch, 'name'), _column(purch, 'kind_name')).astype('float64')
+    keep = ~np.isnan(price) & (np.nan_to_num(price) != 0)
+    purch = purch[keep]
+    rows = purch['_row'].to_numpy()
+    year = _column(purch, 'year').to_numpy(dtype='float64')
+    parts.append(_event_part(
+        'purch', rows, purch['_order'], numbered_labels('purch', purch), ('구매:' + _to_str(_column(purch, 'name'))).to_numpy(),
+        year - birth[rows], year, detail=_column(purch, 'kind_name'), brand=_column(purch, 'brand_name'),
+        price=price[keep]))
+
+    return pd.concat(parts, ignore_index=True)
+
+
+@staged('option3')
 def process_selected_files_3(dataframes, filenames, locations=['KOR'], price_file=price_file):
     """
     Process selected JSON files to filter historical data by sorting of event sequence and merge with price information.
 
     Parameters:
-        - dataframes: List of DataFrames created from JSON files.
+        - dataframes: List of DataFrames created from JSON files, or their
+          normalized tables from `normalize_survey`.
         - filenames: List of filenames corresponding to the dataframes.
         - price_file: The path to the CSV file containing price information.
 
     Returns:
-        - A DataFrame containing the final merged and processed results.
+        - A DataFrame with one row per life event or priced purchase. `source`,
+          `region`, `header`, `sequence` and `condition` are categoricals;
+          `age` and `year` are nullable integers.
     """
-    # Load price data
-    price_df = load_price_data(price_file)
+    # Load price data (reloaded only when the file changes)
+    catalog = get_price_catalog(price_file)
 
-    # Ensure necessary columns are present in the price data
-    required_cols = ['name', 'kind_name']
-    if not all(col in price_df.columns for col in required_cols):
-        raise KeyError("The price file is missing required columns: 'name', 'kind_name'.")
+    columns = ['source', 'region', 'id', 'header', 'sequence', 'condition', 'age', 'year', 'detail', 'brand', 'price']
 
-    # Initialize lists to collect results
-    check = []
+    # Build one typed event table per file
+    event_tables = []
+    for file_index, (df, filename) in enumerate(zip(dataframes, filenames)):
+        source_name = filename.split('_')[0] if '_' in filename else filename
 
-    # Create a dictionary for quick price lookup
-    price_dict = {(row['product_id'], row['kind']): row['price'] for _, row in price_df.iterrows()}
+        with stage('option3.select', file=filename) as record:
+            tables = _as_tables(df)
+            record['rows_in'] = len(tables['person'])
+            tables = _select_people(tables, tables['person']['region'].isin(locations))
+            people = tables['person']
+            record['rows_out'] = len(people)
+        with stage('option3.events', rows_in=len(people), file=filename) as record:
+            events = _life_event_table(tables, catalog)
+            record['rows_out'] = len(events)
+        rows = events['_row'].to_numpy()
+        events.insert(0, '_file', file_index)
+        events.insert(1, 'source', source_name)
+        events.insert(2, 'region', people['region'].to_numpy(dtype=object)[rows])
+        events.insert(3, 'id', people['id'].to_numpy()[rows])
+        event_tables.append(events)
 
-    # Sample loop through dataframes
-    for df, filename in zip(dataframes, filenames):
-        source_name = filename.split('_')[0] if '_' in filename else filename
-        
-        filtered_df = df[df['region'].isin(locations)]
+    if not event_tables:
+        listup = pd.DataFrame([], columns=columns)
+    else:
+        # Stable sort by region, id and age; ties keep the per-respondent event order
+        with stage('option3.sort') as record:
+            listup = pd.concat(event_tables, ignore_index=True)
+            listup = listup.sort_values(['region', 'id', 'age', '_file', '_row', '_kind', '_seq'], kind='stable', na_position='last')
+            record['rows_in'] = record['rows_out'] = len(listup)
 
-        # Convert DataFrame to list of dictionaries for faster processing
-        records = filtered_df.to_dict(orient='records')
+    with stage('option3.dtypes', rows_in=len(listup)):
+        return _typed_event_table(listup.reindex(columns=columns).reset_index(drop=True))
 
-        for d in records:
-        
-            # Basic demographic info extraction
-            id = d['id']
-            region = d['region']
-            marriage = '기혼' if d['marriage'] > 0 else '미혼'
-            last_ed = {'high': '고등졸업', 'college': '학사졸업', 'master': '석사졸업', 'phd': '박사졸업'}[d['education']['history'][0]['level']]
-
-            # Conditional check for marital status
-            if marriage == '기혼':
-                married_age = d['marriage'] - d['birth']
-                check.append([source_name, region, id, 'marriage', 'marriage', '결혼', married_age, d['marriage']])
-
-            # Processing educational history
-            ed_hist = sorted(d['education']['history'], key=itemgetter('age'))
-            check.extend([[source_name, region, id, 'edu', f'edu_{i+1}', last_ed, d['age'], hist['year']] for i, hist in enumerate(ed_hist)])
-
-            # Processing job history
-            job_hist = sorted(d['job']['history'], key=itemgetter('job_age_of'))
-            check.extend([[source_name, region, id, 'job', f'job_{i+1}', hist['job_name'], hist['job_age_of'], hist['year'], hist['job_wage']] for i, hist in enumerate(job_hist)])
-
-            # Processing residence history
-            res_hist = sorted(d['residence']['history'], key=itemgetter('age_of_move_in'))
-            check.extend([[source_name, region, id, 'move', f'move_{i+1}', f"{hist['ownership']}_{hist['type']}_{hist['size']}", hist['age_of_move_in'], hist['year']] for i, hist in enumerate(res_hist)])
-
-            # Processing interior history
-            int_hist = sorted(d['interior']['history'], key=itemgetter('year'))
-            check.extend([[source_name, region, id, 'int', f'int_{i+1}', '인테리어', hist['year'] - d['birth'], hist['year'], hist['cost_amt']] for i, hist in enumerate(int_hist)])
-
-            # Processing children history
-            child_hist = d['children']['history']
-            for i, hist in enumerate(child_hist):
-                events = [
-                    (hist['year'], f'자녀출산_{hist["order"]}', hist['age_of_birth']),
-                    (hist.get('year_elementary'), f'자녀초입_{hist["order"]}', hist['year_elementary'] - d['birth'] if hist.get('year_elementary') is not None else None),
-                    (hist.get('year_middle'), f'자녀중입_{hist["order"]}', hist['year_middle'] - d['birth'] if hist.get('year_middle') is not None else None),
-                    (hist.get('year_high'), f'자녀고입_{hist["order"]}', hist['year_high'] - d['birth'] if hist.get('year_high') is not None else None),
-                    (hist.get('married_year'), f'자녀결혼_{hist["order"]}', hist['married_year'] - d['birth'] if hist.get('married_year') is not None else None)
-                ]
-                check.extend([[source_name, region, id, 'child', f'child_{i+1}', event[1], event[2], event[0]] for event in events if event[0] is not None and event[0] > 0])
-
-            # Processing pet history
-            pet_hist = sorted(d['pet']['history'], key=itemgetter('year'))
-            check.extend([[source_name, region, id, 'pet', f'pet_{i+1}', '애완동물입양', hist['year'] - d['birth'], hist['year'], hist['kind']] for i, hist in enumerate(pet_hist)])
-
-            # Processing car history
-            car_hist = sorted(d['vehicle']['history'], key=itemgetter('year'))
-            check.extend([[source_name, region, id, 'car', f'car_{i+1}', '자동차구매', hist['year'] - d['birth'], hist['year'], f"{hist['purchase']}_{hist['make']}_{hist['kind']}"] for i, hist in enumerate(car_hist)])
-
-            # Processing purchase history
-            purch_hist = sorted(d['purchase']['history'], key=itemgetter('year'))
-            for i, hist in enumerate(purch_hist):
-                price_info = price_dict.get((hist['name'], hist['kind_name']), None)
-                if price_info:
-                    check.append([source_name, region, id, 'purch', f'purch_{i+1}', f"구매:{hist['name']}", hist['year'] - d['birth'], hist['year'], hist['kind_name'], hist['brand_name'], price_info])
-
-    # Sorting the collected data
-    check = sorted(check, key=itemgetter(1, 2, 6))
-
-    # Creating a DataFrame for the results
-    listup = pd.DataFrame(check, columns=['source', 'region', 'id', 'header', 'sequence', 'condition', 'age', 'year', 'detail', 'brand', 'price'])
 
+def _typed_event_table(listup):
+    """
+    Apply the categorical and nullable integer dtypes of the Option 3 output.
+    """
+    listup['source'] = listup['source'].astype('category')
+    listup['region'] = listup['region'].astype('category')
+    listup['header'] = pd.Categorical(listup['header'], categories=LIFE_EVENT_HEADERS)
+    listup['sequence'] = listup['sequence'].astype('category')
+    listup['condition'] = listup['condition'].astype('category')
+    listup['age'] = listup['age'].astype('Int64')
+    listup['year'] = listup['year'].astype('Int64')
     return listup
 
-def process_selected_files_4(dataframes):
-    return pd.concat(dataframes, axis=0, ignore_index=True)
+# --- Parallel Execution ---
+def _slice_people(tables, start, stop):
+    """
+    Return the normalized tables of respondents `start` to `stop` (person positions).
+
+    Child tables are sorted by `_row` (as produced by `normalize_survey`), so each
+    one is sliced with a binary search instead of a full scan.
+    """
+    sliced = {'person': tables['person'].iloc[start:stop].reset_index(drop=True)}
+    for key in HISTORY_KEYS:
+        table = tables[key]
+        lo, hi = np.searchsorted(table['_row'].to_numpy(), [start, stop])
+        table = table.iloc[lo:hi].reset_index(drop=True)
+        table['_row'] = table['_row'] - start
+        sliced[key] = table
+    return sliced
+
+
+def _result_sort(option):
+    """
+    Return the sort keys and final dtype fix-up of a processing option's output.
+    """
+    if option is process_selected_files_1:
+        return ['id', 'region'], _typed_demographics
+    if option is process_selected_files_2:
+        return ['country', 'id', 'age'], None
+    if option is process_selected_files_3:
+        return ['region', 'id', 'age'], _typed_event_table
+    raise ValueError(f"Unsupported processing option: {option!r}")
+
+
+def source_label(option, filename):
+    """
+    Return the `source` value a processing option writes for a file.
+    """
+    if option is process_selected_files_1:
+        return filename.split('_')[0] + "_" + filename.split('_')[1]
+    if option is process_selected_files_2:
+        return filename.split('_')[0] + "_" + filename.split('_')[1] if '_' in filename else filename
+    if option is process_selected_files_3:
+        return filename.split('_')[0] if '_' in filename else filename
+    raise ValueError(f"Unsupported processing option: {option!r}")
+
+
+def merge_partial_results(option, results):
+    """
+    Combine partial outputs of a processing option into the serial result.
+
+    Parameters:
+        - option: The processing function that produced the results.
+        - results: List of partial DataFrames in file/respondent order.
+
+    Returns:
+        - The concatenated DataFrame, stably sorted on the option's sort keys.
+    """
+    sort_keys, finalize = _result_sort(option)
+    non_empty = [result for result in results if not result.empty]
+    if not non_empty:
+        return results[0] if results else option([], [])
+    if len(non_empty) == 1:
+        return non_empty[0]
+
+    # Categoricals with different categories are combined as plain values
+    parts = [result.astype({c: object for c in result.columns if isinstance(result[c].dtype, pd.CategoricalDtype)})
+             for result in non_empty]
+    merged = pd.concat(parts, ignore_index=True)
+    merged = merged.sort_values(sort_keys, kind='stable', na_position='last').reset_index(drop=True)
+    if finalize is not None:
+        return finalize(merged)
+    # Re-infer columns that were all missing in some of the partial results
+    return merged.infer_objects()
+
+
+def split_tasks(dataframes, filenames, chunk_size=None):
+    """
+    Split files into (tables, filename) tasks, one per file or per respondent chunk.
+
+    Running an option on every task and combining the outputs with
+    `merge_partial_results` gives the same result as one serial run.
+    """
+    tasks = []
+    for data, filename in zip(dataframes, filenames):
+        tables = _as_tables(data)
+        size = len(tables['person'])
+        if chunk_size and size > chunk_size:
+            tasks.extend((_slice_people(tables, start, start + chunk_size), filename)
+                         for start in range(0, size, chunk_size))
+        else:
+            tasks.append((tables, filename))
+    return tasks
+
+
+@staged('process_parallel')
+def process_parallel(option, dataframes, filenames, workers=None, chunk_size=None, progress=None, on_result=None,
+                     **kwargs):
+    """
+    Run a processing option over several files (and respondent chunks) in a process pool.
+
+    Workers are started with the 'spawn' method: the app runs this from a job
+    thread of the Streamlit server, and forking a process with other threads
+    running (tornado, pyarrow) can deadlock the children.
+
+    Parameters:
+        - option: One of `process_selected_files_1/2/3`.
+        - dataframes: List of DataFrames or normalized tables.
+        - filenames: List of filenames corresponding to the dataframes.
+        - workers: Number of worker processes (default: number of CPUs); 1 runs
+          the tasks serially in this process.
+        - chunk_size: Split files with more respondents than this into chunks.
+        - progress: Optional callable `progress(done, total)` called as tasks
+          finish. An exception it raises (e.g. a cancelled job) stops the run
+          and drops the tasks that have not started.
+        - on_result: Optional callable `on_result(filename, result)` called with
+          the output of every task (e.g. to aggregate it per file) before the merge.
+        - **kwargs: Parameters passed to the option (locations, year, price_file).
+
+    Returns:
+        - The same DataFrame the option returns when run serially over all files.
+    """
+    tasks = split_tasks(dataframes, filenames, chunk_size)
+    total = len(tasks)
+    workers = workers or os.cpu_count() or 1
+    if progress is not None:
+        progress(0, total)
+    if total <= 1 or workers == 1:
+        results = []
+        for tables, filename in tasks:
+            results.append(option([tables], [filename], **kwargs))
+            if progress is not None:
+                progress(len(results), total)
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, total), mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futures = [executor.submit(option, [tables], [filename], **kwargs) for tables, filename in tasks]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if progress is not None:
+                    progress(total - len(pending), total)
+            results = [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if on_result is not None:
+        for (_, filename), result in zip(tasks, results):
+            on_result(filename, result)
+    with stage('merge_partial_results', rows_in=sum(len(result) for result in results)):
+        return merge_partial_results(option, results)
+
+
+# --- Deduplicated Multi-Source Union ---
+# How respondents sharing a (source, id) key with differing records are resolved
+UNION_POLICIES = ['last', 'first', 'most_complete', 'error']
+
+
+def _row_hashes(table, drop=()):
+    """
+    Hash every row of a table into a uint64.
+
+    Nested cells that pandas cannot hash (dicts, lists) are hashed by their text.
+    """
+    data = table.drop(columns=[c for c in drop if c in table.columns])
+    for column in data.columns:
+        if data[column].dtype == object and data[column].map(lambda v: isinstance(v, (dict, list))).any():
+            data = data.assign(**{column: data[column].astype(str)})
+    return pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+
+def _record_hashes(tables, positions=None):
+    """
+    Hash the person row and every history of respondents.
+
+    Parameters:
+        - tables: Normalized tables from `normalize_survey`.
+        - positions: Person positions to hash (default: every respondent).
+
+    Returns:
+        - A DataFrame with one row per position: the 'person' row hash and, per
+          history, the sum of its entries' row hashes (sums wrap around, which
+          is fine for change detection).
+    """
+    person = tables['person']
+    positions = np.arange(len(person)) if positions is None else np.asarray(positions)
+    slots = np.full(len(person), -1, dtype='int64')
+    slots[positions] = np.arange(len(positions))
+    columns = {'person': _row_hashes(person.iloc[positions])}
+    for key in HISTORY_KEYS:
+        table = tables[key]
+        sums = np.zeros(len(positions), dtype='uint64')
+        rows = slots[table['_row'].to_numpy()] if len(table) else np.array([], dtype='int64')
+        selected = rows >= 0
+        if selected.any():
+            np.add.at(sums, rows[selected], _row_hashes(table[selected], drop=['_row']))
+        columns[key] = sums
+    return pd.DataFrame(columns)
+
+
+def _record_values(series):
+    """
+    Return a normalized column as the values of the source records.
+
+    Integer fields with gaps were widened to floats when the records were
+    loaded; they are turned back into integers. Missing values become None.
+    """
+    if pd.api.types.is_float_dtype(series.dtype):
+        present = series.dropna().to_numpy()
+        if len(present) and np.isfinite(present).all() and (present == np.round(present)).all():
+            series = series.astype('Int64')
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _nested_history(table, size):
+    """
+    Rebuild the nested `{'history': [...]}` cells of one history from its long table.
+
+    Every entry gets every field of the table, with None where it had no value.
+    """
+    fields = [column for column in table.columns if column not in ('_row', 'id', '_seq')]
+    columns = [_record_values(table[field]) for field in fields]
+    entries = [dict(zip(fields, row)) for row in zip(*columns)] if fields else [{} for _ in range(len(table))]
+    offsets = history_offsets(table, size)
+    return [{'history': entries[offsets[i]:offsets[i + 1]]} for i in range(size)]
+
+
+def _nest_columns(person):
+    """
+    Turn the dotted columns of a person table (e.g. `income.hh_income_range`)
+    back into dictionary columns, undoing `_flatten_person`.
+
+    Respondents without any of the dictionary's values get None.
+    """
+    groups = {}
+    for column in person.columns:
+        if '.' in column and column.split('.', 1)[0] not in person.columns:
+            groups.setdefault(column.split('.', 1)[0], []).append(column)
+    for name, columns in groups.items():
+        paths = [column.split('.')[1:] for column in columns]
+        values = [_record_values(person[column]) for column in columns]
+        cells = []
+        for row in zip(*values):
+            if all(value is None for value in row):
+                cells.append(None)
+                continue
+            cell = {}
+            for path, value in zip(paths, row):
+                target = cell
+                for part in path[:-1]:
+                    target = target.setdefault(part, {})
+                target[path[-1]] = value
+            cells.append(cell)
+        position = person.columns.get_loc(columns[0])
+        person = person.drop(columns=columns)
+        person.insert(position, name, cells)
+    return person
+
+
+def union_source(filename):
+    """
+    Return the `source` of a file in the union (vendor and year, e.g. 'Ipsos_2024').
+    """
+    return filename.split('_')[0] + "_" + filename.split('_')[1] if '_' in filename else filename
+
+
+def _respondent_keys(source_codes, ids):
+    """
+    Build one int64 key per row for the (source, id) pair.
+
+    Rows without an id get a unique negative key, so they are never merged.
+
+    Returns:
+        - (keys, id_codes, id_uniques)
+    """
+    id_codes, id_uniques = pd.factorize(ids)
+    keys = source_codes.astype('int64') * (len(id_uniques) + 1) + id_codes
+    missing = id_codes < 0
+    keys[missing] = -1 - np.flatnonzero(missing)
+    return keys, id_codes, id_uniques
+
+
+def _union_winners(tables, keys, policy):
+    """
+    Choose the row kept for every (source, id) key.
+
+    Only respondents whose key occurs more than once are compared (on their
+    person fields and all their histories), so unions of mostly distinct files
+    cost one hash lookup per row.
+
+    Returns:
+        - (keep, conflicts): Boolean mask of the kept rows and the keys whose
+          duplicate records differ.
+    """
+    key_series = pd.Series(keys)
+    duplicated = key_series.duplicated(keep=False).to_numpy()
+    if not duplicated.any():
+        return np.ones(len(keys), dtype=bool), np.array([], dtype='int64')
+
+    # Identical copies are one record; only differing copies are conflicts
+    positions = np.flatnonzero(duplicated)
+    record_hashes = pd.util.hash_pandas_object(_record_hashes(tables, positions), index=False).to_numpy()
+    copies = pd.DataFrame({'key': keys[positions], 'hash': record_hashes})
+    distinct = copies.groupby('key', sort=False)['hash'].nunique()
+    conflicts = distinct.index[distinct.to_numpy() > 1].to_numpy()
+
+    if policy == 'error':
+        if len(conflicts):
+            raise ValueError(f"{len(conflicts)} respondent(s) have conflicting records in the selected files.")
+        policy = 'first'
+    if policy in ('first', 'last'):
+        return ~key_series.duplicated(keep=policy).to_numpy(), conflicts
+
+    # most_complete: most non-missing person fields plus history entries, the later record on ties
+    person = tables['person']
+    score = person.iloc[positions].notna().sum(axis=1).to_numpy()
+    for key in HISTORY_KEYS:
+        rows = tables[key]['_row'].to_numpy()
+        score = score + np.bincount(rows, minlength=len(person))[positions]
+    order = np.lexsort((-positions, -score, keys[positions]))
+    ranked = keys[positions][order]
+    first = np.r_[True, ranked[1:] != ranked[:-1]]
+    keep = ~duplicated
+    keep[positions[order[first]]] = True
+    return keep, conflicts
+
+
+def union_respondents(dataframes, filenames, policy='last'):
+    """
+    Union respondents of several files, deduplicating them on (source, id).
+
+    Parameters:
+        - dataframes: List of DataFrames created from JSON files, or their
+          normalized tables.
+        - filenames: List of filenames corresponding to the dataframes.
+        - policy: How copies of a respondent that differ (in any person field
+          or history entry) are resolved:
+            'last': keep the copy of the later file (or later row),
+            'first': keep the first copy,
+            'most_complete': keep the copy with the most non-missing fields
+              and history entries,
+            'error': raise a ValueError.
+          Identical copies are always collapsed into one row.
+
+    Returns:
+        - (result, stats): The united respondents in file/row order, with `source`
+          and `cid` columns first, the person fields (dictionary fields such
+          as `income` nested again), and one nested `{'history': [...]}` column
+          per history; and the counts of input
+          rows, kept rows, dropped duplicates and conflicting respondents.
+    """
+    if policy not in UNION_POLICIES:
+        raise ValueError(f"Unsupported union policy: {policy}")
+
+    with stage('option4.concat') as record:
+        parts = [_as_tables(data) for data in dataframes] or [normalize_survey(pd.DataFrame())]
+        labels = [union_source(filename) for filename in filenames]
+        label_codes, sources = pd.factorize(pd.Index(labels))
+        source_codes = np.repeat(label_codes, [len(part['person']) for part in parts[:len(labels)]])
+        tables = parts[0] if len(parts) == 1 else _concat_tables(parts)
+        person = tables['person']
+        record['rows_out'] = len(person)
+    if len(person) and 'id' not in person.columns:
+        raise ValueError("The selected files have no 'id' column to unite respondents on.")
+
+    with stage('option4.dedupe', rows_in=len(person)) as record:
+        ids = person['id'] if 'id' in person.columns else pd.Series([], dtype=object)
+        keys, id_codes, id_uniques = _respondent_keys(source_codes, ids)
+        keep, conflicts = _union_winners(tables, keys, policy)
+        kept = _select_people(tables, keep)
+        result = _nest_columns(kept['person'])
+        record['rows_out'] = len(result)
+
+    with stage('option4.cid', rows_in=len(result)):
+        # Convert each distinct source and id to text once, then join the columns
+        source_text = pd.Series(np.asarray(sources, dtype=object)[source_codes[keep]], dtype='str')
+        id_text = np.append(np.asarray(_to_str(pd.Series(id_uniques, dtype=object)), dtype=object), 'None')
+        result.insert(0, 'source', pd.Categorical(source_text, categories=list(sources)))
+        result.insert(1, 'cid', source_text + '_' + pd.Series(id_text[id_codes[keep]], dtype='str'))
+
+    with stage('option4.histories', rows_in=len(result)):
+        # Histories that occur in the files go back into nested columns, like the source records
+        for key in HISTORY_KEYS:
+            if len(tables[key]) or len(tables[key].columns) > 3:
+                result[key] = _nested_history(kept[key], len(result))
+
+    stats = {
+        'rows': len(person),
+        'kept': len(result),
+        'duplicates': len(person) - len(result),
+        'conflicts': len(conflicts),
+    }
+    return result, stats
+
+
+@staged('option4')
+def process_selected_files_4(dataframes, filenames, policy='last'):
+    """
+    Union the respondents of the selected files without duplicates.
+
+    See `union_respondents` for the parameters; only the united DataFrame is returned.
+    """
+    return union_respondents(dataframes, filenames, policy)[0]
@@ -0,0 +1,182 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Optional dependency: without it uploads are always parsed from JSON
+    pa = None
+    feather = None
+
+# --- Snapshot Location and Format ---
+SNAPSHOT_DIR = ".snapshots"
+# Bump when the normalized table layout changes so older snapshots are ignored
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def snapshots_available():
+    """
+    Return True if pyarrow is installed and snapshots can be written and read.
+    """
+    return pa is not None
+
+
+def snapshot_path(key, directory=SNAPSHOT_DIR):
+    """
+    Return the directory holding the snapshot of a content key (e.g. a file digest).
+    """
+    return os.path.join(directory, key)
+
+
+def _arrow_columns(df):
+    """
+    Return the columns of a table that Arrow can store as typed columns.
+
+    Columns mixing value types (e.g. numbers and strings in the same field)
+    are left out.
+    """
+    columns = []
+    for column in df.columns:
+        try:
+            pa.Table.from_pandas(df[[column]], preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            continue
+        columns.append(column)
+    return columns
+
+
+def _write_table(df, path):
+    """
+    Write one table as an uncompressed Arrow IPC (Feather v2) file.
+
+    Columns Arrow cannot store are pickled to a side file, so every table
+    still round-trips exactly.
+
+    Returns:
+        - The table entry of the manifest: the column order and the pickled columns.
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pickled = []
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        arrow_columns = _arrow_columns(df)
+        pickled = [column for column in df.columns if column not in arrow_columns]
+        table = pa.Table.from_pandas(df[arrow_columns], preserve_index=False)
+        df[pickled].to_pickle(path + ".pkl")
+    # Uncompressed files can be memory-mapped without decoding
+    feather.write_feather(table, path + ".arrow", compression="uncompressed")
+    return {"columns": list(df.columns), "pickled": pickled}
+
+
+def _read_table(path, entry):
+    """
+    Read a table written by `_write_table`, memory-mapping its Arrow file.
+    """
+    df = feather.read_table(path + ".arrow", memory_map=True).to_pandas()
+    if entry["pickled"]:
+        df = pd.concat([df, pd.read_pickle(path + ".pkl")], axis=1)[entry["columns"]]
+    return df
+
+
+def save_snapshot(tables, key, directory=SNAPSHOT_DIR):
+    """
+    Store normalized tables on disk as a columnar snapshot.
+
+    The snapshot is written to a temporary directory and moved into place, so
+    a concurrent reader never sees a partial snapshot.
+
+    Parameters:
+        - tables: Dictionary of DataFrames (e.g. from `normalize_survey`).
+        - key: Content key of the source (e.g. the upload's SHA-256 digest).
+        - directory: Root directory of the snapshots.
+
+    Returns:
+        - The snapshot path, or None if pyarrow is not installed.
+    """
+    if not snapshots_available():
+        return None
+    os.makedirs(directory, exist_ok=True)
+    target = snapshot_path(key, directory)
+    staging = tempfile.mkdtemp(prefix=f".{key}-", dir=directory)
+    try:
+        entries = {}
+        for i, (name, df) in enumerate(tables.items()):
+            entries[name] = _write_table(df, os.path.join(staging, f"{i:02d}"))
+            entries[name]["file"] = f"{i:02d}"
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as file:
+            json.dump({"version": SNAPSHOT_VERSION, "tables": entries}, file, ensure_ascii=False)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(target):
+            raise
+    return target
+
+
+def load_snapshot(key, directory=SNAPSHOT_DIR):
+    """
+    Load the normalized tables of a content key from its snapshot.
+
+    Arrow files are memory-mapped, so columns are read from the page cache
+    instead of being parsed.
+
+    Parameters:
+        - key: Content key the snapshot was saved under.
+        - directory: Root directory of the snapshots.
+
+    Returns:
+        - A dictionary of DataFrames, or None if there is no usable snapshot.
+    """
+    if not snapshots_available():
+        return None
+    path = snapshot_path(key, directory)
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    tables = {}
+    try:
+        for name, entry in manifest["tables"].items():
+            tables[name] = _read_table(os.path.join(path, entry["file"]), entry)
+    except (OSError, KeyError, ValueError, EOFError, AttributeError, ImportError, TypeError,
+            pickle.UnpicklingError):
+        # Corrupt or incompatible files (e.g. a pickle from another pandas version) are a cache miss
+        return None
+    # Touch the manifest so pruning removes the least recently used snapshots first
+    os.utime(os.path.join(path, MANIFEST))
+    return tables
+
+
+def prune_snapshots(directory=SNAPSHOT_DIR, max_bytes=20 << 30):
+    """
+    Delete the least recently used snapshots until the directory fits in `max_bytes`.
+    """
+    if not os.path.isdir(directory):
+        return
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        manifest = os.path.join(path, MANIFEST)
+        if name.startswith(".") or not os.path.isfile(manifest):
+            continue
+        size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        entries.append((os.path.getmtime(manifest), size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -0,0 +1,70 @@
+import random
+
+import pandas as pd
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from benchmark import generate_respondent, load_products  # noqa: E402
+from mongo_source import build_pipeline, load_mongo_collections, processing_fields  # noqa: E402
+from processing import (  # noqa: E402
+    process_selected_files_1,
+    process_selected_files_2,
+    process_selected_files_3,
+)
+
+
+@pytest.fixture
+def client():
+    rnd = random.Random(0)
+    products = load_products()
+    records = [generate_respondent(i, rnd, products) for i in range(200)]
+    records[0]['region'] = 'US'
+    records[1].pop('region')
+    records[2]['purchase'] = {'history': [{'year': 2005, 'name': 'x'}, {'year': 2016, 'name': 'y'}]}
+    records[2]['region'] = 'KOR'
+    records[2]['unused_field'] = 'dropped by the projection'
+    client = mongomock.MongoClient()
+    client['clue']['Ipsos_2024'].insert_many(records)
+    return client
+
+
+def test_build_pipeline_filters_and_projects():
+    pipeline = build_pipeline(locations=['KOR'], min_year=2010, fields=['id', 'region'])
+    # Documents without a region count as KOR
+    assert pipeline[0] == {'$match': {'$or': [{'region': {'$in': ['KOR']}}, {'region': None}]}}
+    assert build_pipeline(locations=['US'])[0] == {'$match': {'region': {'$in': ['US']}}}
+    assert pipeline[1]['$addFields']['purchase.history']['$filter']['cond'] == {'$gte': ['$$hist.year', 2010]}
+    assert pipeline[-1] == {'$project': {'id': 1, 'region': 1, '_id': 0}}
+    assert build_pipeline() == [{'$project': {'_id': 0}}]
+
+
+def test_load_filters_regions_years_and_fields(client):
+    df = load_mongo_collections(['Ipsos_2024'], client=client, locations=['KOR'], min_year=2010,
+                                fields=processing_fields())['Ipsos_2024']
+    assert set(df['region'].dropna()) == {'KOR'}
+    assert 0 not in set(df['id']) and 1 in set(df['id'])
+    assert set(df.columns) <= set(processing_fields())
+    assert '_id' not in df.columns and 'unused_field' not in df.columns
+    history = df.loc[df['id'] == 2, 'purchase'].iloc[0]['history']
+    assert [hist['year'] for hist in history] == [2016]
+
+
+def test_load_normalized_tables(client):
+    tables = load_mongo_collections(['Ipsos_2024'], client=client, locations=['KOR', 'US'],
+                                    normalize=True)['Ipsos_2024']
+    assert len(tables['person']) == 200
+    assert (tables['purchase']['_row'].diff().dropna() >= 0).all()
+
+
+@pytest.mark.parametrize('option, kwargs', [
+    (process_selected_files_1, {'locations': ['KOR', 'US']}),
+    (process_selected_files_2, {'year': 2010, 'locations': ['KOR', 'US']}),
+    (process_selected_files_3, {'locations': ['KOR', 'US']}),
+])
+def test_projection_keeps_option_results(client, option, kwargs):
+    full = load_mongo_collections(['Ipsos_2024'], client=client, normalize=True)
+    projected = load_mongo_collections(['Ipsos_2024'], client=client, normalize=True, fields=processing_fields())
+    expected = option([full['Ipsos_2024']], ['Ipsos_2024'], **kwargs)
+    result = option([projected['Ipsos_2024']], ['Ipsos_2024'], **kwargs)
+    pd.testing.assert_frame_equal(result, expected)
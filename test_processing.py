@@ -0,0 +1,46 @@
+import random
+
+import pandas as pd
+import pytest
+
+from benchmark import generate_respondent, load_products
+from processing import filter_records, normalize_survey, process_selected_files_1, select_regions, union_respondents
+
+
+@pytest.fixture
+def records():
+    rnd = random.Random(0)
+    products = load_products()
+    return [generate_respondent(i, rnd, products) for i in range(50)]
+
+
+@pytest.mark.parametrize('normalized', [False, True])
+def test_union_of_one_file_round_trips(records, normalized):
+    data = pd.DataFrame(records)
+    result, stats = union_respondents([normalize_survey(data) if normalized else data], ['Ipsos_2024_a.json'])
+    assert stats == {'rows': 50, 'kept': 50, 'duplicates': 0, 'conflicts': 0}
+    pd.testing.assert_frame_equal(result.drop(columns=['source', 'cid']), pd.DataFrame(records), check_like=True)
+
+
+def test_union_compares_histories(records):
+    changed = [dict(record) for record in records]
+    changed[3] = dict(changed[3], education={'history': []})
+    files = [normalize_survey(pd.DataFrame(records)), normalize_survey(pd.DataFrame(changed))]
+    result, stats = union_respondents(files, ['Ipsos_2024_a.json', 'Ipsos_2024_b.json'], policy='last')
+    assert stats['conflicts'] == 1 and stats['kept'] == 50
+    assert result.loc[result['id'] == 3, 'education'].iloc[0] == {'history': []}
+    with pytest.raises(ValueError):
+        union_respondents(files, ['Ipsos_2024_a.json', 'Ipsos_2024_b.json'], policy='error')
+
+
+def test_prefilter_keeps_respondents_without_region(records):
+    for record in records:
+        record.pop('region')
+    expected = process_selected_files_1([pd.DataFrame(records)], ['Ipsos_2024_a.json'], locations=['KOR'])
+    assert len(expected) == 50
+    loaded = pd.DataFrame(list(filter_records(records, locations=['KOR', 'US'])))
+    selected = select_regions(normalize_survey(pd.DataFrame(records)), ['KOR', 'US'])
+    for data in (loaded, selected):
+        pd.testing.assert_frame_equal(
+            process_selected_files_1([data], ['Ipsos_2024_a.json'], locations=['KOR']), expected)
+    assert list(filter_records(records, locations=['US'])) == []